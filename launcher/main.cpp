@@ -1,5 +1,6 @@
 #define PY_SSIZE_T_CLEAN
 #include <windows.h>
+#include <shellapi.h>
 #include "Python.h"
 
 #include <iostream>
@@ -31,6 +32,35 @@ std::string GetPythonError() {
     return result;
 }
 
+std::string WideToUtf8(const wchar_t* text) {
+    int size = WideCharToMultiByte(CP_UTF8, 0, text, -1, NULL, 0, NULL, NULL);
+    if (size <= 0) return "";
+    std::string result(size - 1, '\0');
+    WideCharToMultiByte(CP_UTF8, 0, text, -1, &result[0], size, NULL, NULL);
+    return result;
+}
+
+// Worker processes of the integrity check's process pool are spawned as
+// "launcher.exe [flags] -c <code> --multiprocessing-fork". Returns the code to
+// run instead of the launcher, or an empty string for a normal start.
+std::string GetSpawnCode() {
+    int argc = 0;
+    LPWSTR* argv = CommandLineToArgvW(GetCommandLineW(), &argc);
+    if (argv == NULL) return "";
+
+    std::string code;
+    if (argc > 2 && wcscmp(argv[argc - 1], L"--multiprocessing-fork") == 0) {
+        for (int i = 1; i < argc - 2; i++) {
+            if (wcscmp(argv[i], L"-c") == 0) {
+                code = WideToUtf8(argv[i + 1]);
+                break;
+            }
+        }
+    }
+    LocalFree(argv);
+    return code;
+}
+
 int APIENTRY WinMain(HINSTANCE hInstance, HINSTANCE hPrevInstance, LPSTR lpCmdLine, int nCmdShow) {
     std::string base_dir = GetExeDir();
     std::string tcl_env = "TCL_LIBRARY=" + base_dir + "\\DLLs\\tcl8.6";
@@ -43,6 +73,14 @@ int APIENTRY WinMain(HINSTANCE hInstance, HINSTANCE hPrevInstance, LPSTR lpCmdLi
 
     Py_Initialize();
 
+    std::string spawn_code = GetSpawnCode();
+    if (!spawn_code.empty()) {
+        // spawn_main exits the process itself with the worker's exit code
+        int spawn_result = PyRun_SimpleString(spawn_code.c_str());
+        Py_FinalizeEx();
+        return spawn_result == 0 ? 0 : 1;
+    }
+
     const char* script = "import importlib.util; "
         "import sys; "
         "spec = importlib.util.spec_from_file_location('__main__', 'launcher.pyc'); "
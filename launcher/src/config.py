@@ -1,15 +1,85 @@
+import os
 import json
+import atexit
 import logging
+import threading
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from pathlib import Path
 from entity import BaseEntity
 
+# Saves within this many seconds of each other are written as one
+SAVE_DEBOUNCE = 0.5
+
+class DebouncedWriter:
+    # Write-behind for one small text file. write() only records the latest
+    # content and re-arms a timer; once it has been quiet for `delay` seconds
+    # the file is replaced atomically (temp file, fsync, rename), so a kill
+    # mid-write never leaves a torn file. Unchanged content is not rewritten.
+    def __init__(self, path: Path, delay: float = SAVE_DEBOUNCE):
+        self.path = path
+        self.delay = delay
+        self.pending: str | None = None
+        self.written: str | None = None
+        self.timer: threading.Timer | None = None
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def write(self, text: str):
+        with self.lock:
+            self.pending = text
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                text, self.pending = self.pending, None
+                if self.timer:
+                    self.timer.cancel()
+                    self.timer = None
+            if text is None or text == self.written:
+                return
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self.written = text
+            except Exception as e:
+                logging.error(f"Failed to save config: {e}")
+
+_writers: dict[Path, DebouncedWriter] = {}
+_writers_lock = threading.Lock()
+
+def _writer_for(path: Path) -> DebouncedWriter:
+    with _writers_lock:
+        key = Path(path).resolve()
+        if key not in _writers:
+            _writers[key] = DebouncedWriter(Path(path))
+        return _writers[key]
+
+@atexit.register
+def flush_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
 @dataclass
 class AppConfig(BaseEntity):
     silentMode: bool = False
     autoUpdate: bool = False
     unlimitLaunchGame: bool = False
+    lookupCacheTTL: int = 600
+    lookupCacheSize: int = 256
+    progressRate: int = 20
+    logMaxLines: int = 1000
 
 @dataclass
 class DownloadConfig(BaseEntity):
@@ -27,10 +97,28 @@ class DownloadConfig(BaseEntity):
     isRepairMode: int = 0
     repairListPath: str = ""
     
+    # Launcher-only settings, never passed to the IPC CLI
+    verifyEngine: str = field(default="thread", metadata={"ipc": False})
+    verifyProcesses: int = field(default=0, metadata={"ipc": False})
+    manifestServerMode: str = field(default="werkzeug", metadata={"ipc": False})
+    mirrorManifests: int = field(default=0, metadata={"ipc": False})
+    raceManifestStrategies: int = field(default=0, metadata={"ipc": False})
+    
     def to_save_dict(self):
         return {
             "isSSD": self.isSSD,
-            "rateLimit": self.rateLimit
+            "rateLimit": self.rateLimit,
+            "verifyEngine": self.verifyEngine,
+            "verifyProcesses": self.verifyProcesses,
+            "manifestServerMode": self.manifestServerMode,
+            "mirrorManifests": self.mirrorManifests,
+            "raceManifestStrategies": self.raceManifestStrategies
+        }
+    
+    def to_ipc_dict(self):
+        return {
+            f.name: getattr(self, f.name)
+            for f in fields(self) if f.metadata.get("ipc", True)
         }
 
 @dataclass
@@ -76,9 +164,10 @@ class ConfigWrapper(BaseEntity):
             "gameConfig": self.gameConfig.to_save_dict()
         }
         
+        # Serialized now so the writer thread never reads live config objects
         path = getattr(self, "_config_path", Path("config.json"))
-        try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(save_config, f, indent=4)
-        except Exception as e:
-            logging.error(f"Failed to save config: {e}")
+        _writer_for(path).write(json.dumps(save_config, indent=4))
+
+    def flush(self):
+        # Writes a pending save immediately; call before os._exit
+        _writer_for(getattr(self, "_config_path", Path("config.json"))).flush()
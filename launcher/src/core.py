@@ -1,18 +1,25 @@
 import os
-import json
 import subprocess
 import threading
-import zmq
 import tempfile
 import logging
+import time
 
 from pathlib import Path
 from config import ConfigWrapper
 from utils import (
-    executor, get_latest_version, parse_game_state, 
-    patch_login, get_downloadable_id, patch_dll
+    executor, lookup_executor, get_latest_version, parse_game_state, 
+    patch_login, get_downloadable_id, patch_dll, launch_fingerprint
 )
-from progress import DownloadProgress
+from ipc_hub import IpcHub
+from progress import ProgressHistory, format_eta
+from lookup_cache import lookup_cache
+from state_cache import game_states
+from process_supervisor import ProcessSupervisor
+
+MANIFEST_SERVER_PORT = 7000
+# Without a GUI, progress is written to the log this often
+HEADLESS_PROGRESS_INTERVAL = 10.0
 
 class DownloaderCore:
     def __init__(self, base_path: Path, config: ConfigWrapper = None, log_callback: callable = None, progress_callback: callable = None):
@@ -25,18 +32,38 @@ class DownloaderCore:
         self.progress_callback = progress_callback
         self.stop_event = threading.Event()
         self.manifest_thread = None
-        self.server_thread = None
+        self.ipc_hub = None
+        self.ipc_session = None
+        self.progress_history = ProgressHistory()
+        self.last_progress_log = 0.0
+        self.state_watch = None
         self.download_thread = None
         self.process = None
-        self.game_process = None
-        self.last_cid = None
-        self.ipc_stop_requested = threading.Event()
+        self.supervisor = ProcessSupervisor()
+        # Fingerprint of the game directory right after the last launch preparation
+        self.launch_fingerprint = None
+        self.verify_lock = threading.Lock()
         self.manifest_server = None
+        lookup_cache.configure(
+            self.config_wrapper._config_path.parent / "lookup_cache.json",
+            ttl=self.app_config.lookupCacheTTL,
+            max_entries=self.app_config.lookupCacheSize,
+            prefer_cache=self.app_config.silentMode
+        )
+
+    @property
+    def last_cid(self) -> bytes | None:
+        return self.ipc_session.cid if self.ipc_session else None
+
+    @property
+    def ipc_metrics(self) -> dict:
+        return self.ipc_session.metrics if self.ipc_session else {"stop_ack_ms": None, "stop_exit_ms": None}
 
     def is_game_running(self):
-        if self.game_process and self.game_process.poll() is None:
-            return True
-        return False
+        return self.supervisor.is_running()
+
+    def game_instances(self, include_exited: bool = False):
+        return self.supervisor.instances(self.game_config.running_process, include_exited)
 
     def log(self, message):
         logging.info(message)
@@ -97,16 +124,52 @@ class DownloaderCore:
                 
         return analysis
 
+    def watch_game_state(self, callback):
+        # callback(old_state, new_state) runs on the watcher thread whenever
+        # downloadIPC rewrites the state file of the configured game path
+        if self.state_watch:
+            self.state_watch.cancel()
+        self.state_watch = None
+        if self.game_config.path:
+            self.state_watch = game_states.watch(self.game_config.path, self.game_config.app_id, callback)
+
     def check_for_updates(self):
-        latest = self.fetch_latest_version()
-        if not latest:
-            return {"success": False, "has_update": False}
-            
+        # The origin lookup does not depend on the latest build, so it runs
+        # alongside fetch_latest_version; only the target lookup has to wait.
+        started = time.perf_counter()
+        timings = {}
+
+        def timed(name, func, *args):
+            def run():
+                t = time.perf_counter()
+                try:
+                    return func(*args)
+                finally:
+                    timings[name] = time.perf_counter() - t
+            return lookup_executor.submit(run)
+
+        content_id = self.game_config.content_id
+        origin_version = self.download_config.originVersion
+        latest_future = timed("latest", self.fetch_latest_version)
+        origin_future = timed("origin_id", get_downloadable_id, content_id, origin_version)
+
         try:
-            origin_id = get_downloadable_id(self.game_config.content_id, self.download_config.originVersion)
-            target_id = get_downloadable_id(self.game_config.content_id, self.download_config.targetVersion)
-            
-            has_update = origin_id < target_id
+            latest = latest_future.result()
+            if not latest:
+                origin_future.cancel()
+                return {"success": False, "has_update": False}
+
+            target_version = self.download_config.targetVersion
+            if self.game_config.content_id == content_id and target_version == origin_version:
+                origin_future.cancel()
+                has_update = False
+            else:
+                target_future = timed("target_id", get_downloadable_id, self.game_config.content_id, target_version)
+                if self.game_config.content_id != content_id:
+                    origin_future.cancel()
+                    origin_future = timed("origin_id", get_downloadable_id, self.game_config.content_id, origin_version)
+                has_update = origin_future.result() < target_future.result()
+
             return {
                 "success": True, 
                 "has_update": has_update, 
@@ -115,27 +178,47 @@ class DownloaderCore:
         except Exception as e:
             self.log(f"Update comparison error: {e}")
             return {"success": False, "has_update": False, "error": str(e)}
+        finally:
+            breakdown = ", ".join(f"{name}={elapsed * 1000:.0f}ms" for name, elapsed in dict(timings).items())
+            logging.info(f"Update check took {(time.perf_counter() - started) * 1000:.0f}ms ({breakdown})")
 
-    def verify_integrity(self, progress_callback=None):
+    def verify_integrity(self, progress_callback=None, force_rehash=False, quick=False):
+        # Returns None when cancelled through stop_event; verified files are
+        # checkpointed so the next check resumes from there.
         from utils import check_resource
-        return check_resource(
-            self.game_config.path, 
-            self.game_config.app_id, 
-            self.game_config.content_id,
-            progress_callback=progress_callback
-        )
+        with self.verify_lock:
+            self.stop_event.clear()
+            return check_resource(
+                self.game_config.path, 
+                self.game_config.app_id, 
+                self.game_config.content_id,
+                progress_callback=progress_callback,
+                force_rehash=force_rehash,
+                quick=quick,
+                is_ssd=bool(self.download_config.isSSD),
+                engine=self.download_config.verifyEngine,
+                processes=self.download_config.verifyProcesses,
+                cancel_event=self.stop_event
+            )
+
+    def cancel_verify(self):
+        self.log("Cancelling integrity check...")
+        self.stop_event.set()
 
     def stop(self):
         self.log("Stopping all tasks...")
         
         if self.process:
             try:
-                if self.last_cid:
+                session = self.ipc_session
+                if session and self.ipc_hub.request_stop(session):
                     self.log("Requesting IPC stop via ZMQ...")
-                    self.ipc_stop_requested.set()
+                    if session.stop_ack.wait(timeout=1):
+                        self.log(f"IPC stop sent in {session.metrics['stop_ack_ms']:.1f}ms")
                     try:
                         self.process.wait(timeout=3)
-                        self.log("Subprocess exited via ZMQ request.")
+                        session.metrics["stop_exit_ms"] = (time.perf_counter() - session.stop_requested_at) * 1000
+                        self.log(f"Subprocess exited via ZMQ request ({self.ipc_metrics['stop_exit_ms']:.0f}ms).")
                     except subprocess.TimeoutExpired:
                         self.log("Subprocess did not exit gracefully, killing...")
                         if os.name == 'nt':
@@ -154,10 +237,17 @@ class DownloaderCore:
                 self.process = None
         
         self.cleanup_servers()
+        if self.ipc_hub:
+            self.ipc_hub.close()
+        # Let a running integrity check write its checkpoint before exiting
+        if self.verify_lock.acquire(timeout=10):
+            self.verify_lock.release()
         self.log("Cleanup request sent.")
 
     def cleanup_servers(self):
         self.stop_event.set()
+        if self.ipc_session:
+            self.ipc_hub.end_session(self.ipc_session, process_exited=self.process is None)
         
         if self.manifest_server:
             try:
@@ -172,18 +262,31 @@ class DownloaderCore:
         self.start_zmq_server()
 
     def start_manifest_server(self):
-        if self.manifest_thread and self.manifest_thread.is_alive():
+        # A thread left over from a server that was already shut down does
+        # not count as running
+        if self.manifest_server and self.manifest_thread and self.manifest_thread.is_alive():
             return
             
         self.log("Starting manifest server...")
         try:
-            from manifest_server import app as manifest_app
-            from werkzeug.serving import make_server
-            
-            self.manifest_server = make_server('127.0.0.1', 7000, manifest_app)
+            import manifest_server
+            from manifest_server import manifest_mirror
+            manifest_server.race_strategies = bool(self.download_config.raceManifestStrategies)
+            manifest_mirror.configure(
+                self.config_wrapper._config_path.parent / "manifest_cache",
+                f"http://127.0.0.1:{MANIFEST_SERVER_PORT}",
+                enabled=bool(self.download_config.mirrorManifests)
+            )
+            if self.download_config.manifestServerMode == "async":
+                from manifest_server import AsyncManifestServer
+                self.manifest_server = AsyncManifestServer('127.0.0.1', MANIFEST_SERVER_PORT)
+            else:
+                from manifest_server import app as manifest_app
+                from werkzeug.serving import make_server
+                self.manifest_server = make_server('127.0.0.1', MANIFEST_SERVER_PORT, manifest_app)
+            server = self.manifest_server
             def run_flask():
-                if self.manifest_server:
-                    self.manifest_server.serve_forever()
+                server.serve_forever()
                     
             self.manifest_thread = threading.Thread(target=run_flask, daemon=True)
             self.manifest_thread.start()
@@ -191,71 +294,37 @@ class DownloaderCore:
             self.log(f"Failed to start manifest server: {e}")
 
     def start_zmq_server(self):
-        if self.server_thread and self.server_thread.is_alive():
-            return
-        self.log("Starting ZMQ server...")
-        self.server_thread = threading.Thread(target=self.run_zmq_server, daemon=True)
-        self.server_thread.start()
+        # The hub binds once and stays up between runs; each run gets a new session
+        if self.ipc_hub is None:
+            self.ipc_hub = IpcHub(self.download_config.pubport, self.download_config.subport, self.log)
+        if not self.ipc_hub.is_running():
+            self.log("Starting ZMQ server...")
+            self.ipc_hub.start()
+        if self.ipc_session:
+            self.ipc_hub.end_session(self.ipc_session)
+        self.progress_history.reset()
+        self.ipc_session = self.ipc_hub.open_session(self._publish_progress, self.app_config.progressRate)
 
-    def run_zmq_server(self):
-        sub_port = self.download_config.pubport
-        pub_port = self.download_config.subport
-        
-        ctx = zmq.Context()
-        sub_sock = ctx.socket(zmq.SUB)
-        sub_sock.bind(f"tcp://127.0.0.1:{sub_port}")
-        sub_sock.setsockopt_string(zmq.SUBSCRIBE, "")
-        
-        pub_sock = ctx.socket(zmq.PUB)
-        pub_sock.bind(f"tcp://127.0.0.1:{pub_port}")
-        
-        poller = zmq.Poller()
-        poller.register(sub_sock, zmq.POLLIN)
+    def _publish_progress(self, progress):
+        self.progress_history.record(progress)
+        if self.app_config.silentMode:
+            self._log_headless_progress(progress)
+        if self.progress_callback:
+            self.progress_callback(progress)
 
-        try:
-            while not self.stop_event.is_set():
-                if self.ipc_stop_requested.is_set():
-                    self.ipc_stop_requested.clear()
-                    if self.last_cid:
-                        pub_sock.send_multipart([self.last_cid, b"3"])
-                        pub_sock.send_multipart([self.last_cid, b"3"])
-                        self.log("Sent stop signal to IPC via ZMQ.")
-                        return
-
-                socks = dict(poller.poll(timeout=100))
-                if sub_sock in socks:
-                    parts = sub_sock.recv_multipart()
-                    if len(parts) != 3: continue
-                    
-                    self.last_cid = parts[0]
-                    cid = self.last_cid
-                    try:
-                        m_type_str = parts[1].decode('utf-8', errors='replace')
-                        m_type = int(m_type_str) if m_type_str.isdigit() else 0
-                        data_raw = parts[2].decode('utf-8', errors='replace')
-                    except Exception: continue
-                    
-                    if m_type == 10 and parts[2] == b"heartbeat":
-                        pub_sock.send_multipart([cid, b"4"])
-                        continue
-                    elif 3 <= m_type <= 8:
-                        data = json.loads(data_raw)
-                        if self.progress_callback:
-                            progress_obj = DownloadProgress.from_dict(data)
-                            self.progress_callback(progress_obj)
-                            
-                    if 8 <= m_type < 2000:
-                        pub_sock.send_multipart([cid, b"3"])
-                        pub_sock.send_multipart([cid, b"3"])
-                        self.log(f"Received stop signal from IPC (type {m_type})")
-                        return
-        except Exception as e:
-            self.log(f"ZMQ Server Error: {e}")
-        finally:
-            sub_sock.close()
-            pub_sock.close()
-            ctx.term()
-            self.log("ZMQ server stopped.")
+    def _log_headless_progress(self, progress):
+        now = time.monotonic()
+        if now - self.last_progress_log < HEADLESS_PROGRESS_INTERVAL:
+            return
+        self.last_progress_log = now
+        phases = ("indexing",) if progress.StateFlags == 3 else ("download", "build")
+        parts = []
+        for phase in phases:
+            stats = self.progress_history.stats(phase, now)
+            eta = format_eta(stats.eta) if stats.eta is not None else "--:--"
+            state = ", stalled" if stats.stalled else ""
+            parts.append(f"{phase} {stats.percent * 100:.1f}% at {stats.rate / (1024*1024):.2f} MB/s, ETA {eta}{state}")
+        logging.info("Progress: " + "; ".join(parts))
 
     def start_download(self, on_finished_callback=None):
         self.stop_event.clear()
@@ -273,13 +342,12 @@ class DownloaderCore:
 
     def execute_binary(self):
         exe_path = self.base_path / "bin" / "downloadIPC.exe"
-        self.last_cid = None # Reset CID for new execution
         
         if not exe_path.exists():
             self.log(f"Error: Could not find {exe_path}")
             return
 
-        param = self.download_config.to_dict()
+        param = self.download_config.to_ipc_dict()
         param["gameid"] = self.game_config.app_id
         param["contentid"] = self.game_config.content_id
         param["path"] = self.game_config.path
@@ -322,29 +390,40 @@ class DownloaderCore:
             return None
         
         try:
-            patch_login(self.game_config.path)
-            dll_path = self.base_path / "bin" / "version.dll"
-            if self.app_config.unlimitLaunchGame:
-                patch_dll(dll_path, Path(self.game_config.path))
-            else:
-                try:
-                    game_dll_path = Path(self.game_config.path) / "version.dll"
-                    if game_dll_path.exists():
-                        game_dll_path.unlink()
-                except Exception as e:
-                    self.log(f"Failed to remove existing version.dll: {e}")
-                
-            # We use shell=True and cwd to ensure the executable is found in the game directory
-            # and that it can load its dependencies.
-            self.game_process = subprocess.Popen(
-                f'"{self.game_config.running_process}" --start_from_launcher=1',
-                shell=True, 
+            self.prepare_launch()
+            # The executable is resolved against the game directory explicitly (no
+            # shell), so the supervisor waits on the game itself rather than on
+            # cmd.exe; cwd still lets it load its dependencies.
+            instance = self.supervisor.spawn(
+                self.game_config.running_process,
+                [str(Path(self.game_config.path) / self.game_config.running_process), "--start_from_launcher=1"],
                 cwd=self.game_config.path
             )
-            self.log(f"Launching game: {self.game_config.running_process} (CWD: {self.game_config.path})")
+            self.log(f"Launching game: {self.game_config.running_process} (PID: {instance.pid}, CWD: {self.game_config.path})")
+            return instance
         except Exception as e:
             self.log(f"Failed to launch game: {e}")
             return None
+
+    def prepare_launch(self):
+        # Patches the game directory for the current launch mode; skipped when
+        # nothing it touches has changed since the last preparation
+        dll_path = self.base_path / "bin" / "version.dll"
+        unlimited = bool(self.app_config.unlimitLaunchGame)
+        if launch_fingerprint(self.game_config.path, dll_path, unlimited) == self.launch_fingerprint:
+            return
+
+        patch_login(self.game_config.path)
+        if unlimited:
+            patch_dll(dll_path, Path(self.game_config.path))
+        else:
+            try:
+                game_dll_path = Path(self.game_config.path) / "version.dll"
+                if game_dll_path.exists():
+                    game_dll_path.unlink()
+            except Exception as e:
+                self.log(f"Failed to remove existing version.dll: {e}")
+        self.launch_fingerprint = launch_fingerprint(self.game_config.path, dll_path, unlimited)
             
     def repair_files(self, repair_list: list[str], on_finished_callback=None):
         with tempfile.NamedTemporaryFile(mode='w', delete=False, encoding='utf-8', suffix='.txt') as tmp:
@@ -1,12 +1,16 @@
 import tkinter as tk
 import os
 
+from collections import deque
 from tkinter import ttk, filedialog, messagebox
 from i18n import I18N
-from progress import DownloadProgress
+from progress import DownloadProgress, format_eta
 from utils import executor
 from core import DownloaderCore
 
+# Queued log lines are written to the log widget this often (ms)
+LOG_FLUSH_INTERVAL = 100
+
 class DownloaderGUI:
     def __init__(self, root: tk.Tk, core: DownloaderCore):
         self.core = core
@@ -21,6 +25,9 @@ class DownloaderGUI:
         
         self.root = root
         self.lang = 'zh'
+        # Lines from any thread wait here for the Tk timer; bounded like the widget
+        self.log_max_lines = max(1, self.app_config.logMaxLines)
+        self.log_queue = deque(maxlen=self.log_max_lines)
         self.texts = I18N[self.lang]
 
         # Initialize core variables before UI setup
@@ -36,13 +43,23 @@ class DownloaderGUI:
             
         # 0: ready, 1: downloading, 2: checking
         self.app_state = 0
+        # Latest progress snapshot waiting for the Tk loop, see on_progress
+        self.pending_progress = None
+        self.progress_scheduled = False
+        self.progress_layout = None
+        self.applied_progress = None
+        self.applied_suffixes = ()
         
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
         # Async fetch version
         self.root.after(0, self.check_path)
+        if not self.app_config.silentMode:
+            self.root.after(LOG_FLUSH_INTERVAL, self._flush_log)
+            self.core.watch_game_state(self._on_game_state_changed)
         
-        self.root.after(2000, self.monitor_game_status)
+        # The supervisor reports game start/exit; the handler hops to the Tk thread
+        self.core.supervisor.subscribe(self._on_game_process_event)
 
     def center_window(self, width, height):
         screen_width = self.root.winfo_screenwidth()
@@ -75,7 +92,7 @@ class DownloaderGUI:
         
         if enabled and hasattr(self, 'repair_button'):
             try:
-                self.repair_button.config(text=self.texts['check_integrity_btn'])
+                self.repair_button.config(text=self.texts['check_integrity_btn'], command=self.check_file_integrity)
             except Exception:
                 pass
 
@@ -274,6 +291,17 @@ class DownloaderGUI:
         )
         self.repair_button.grid(row=0, column=2, sticky='ew', padx=(2, 0))
 
+        self.repair_menu = tk.Menu(self.root, tearoff=0)
+        self.repair_menu.add_command(
+            label=self.texts['quick_check_integrity_btn'],
+            command=lambda: self.check_file_integrity(quick=True)
+        )
+        self.repair_menu.add_command(
+            label=self.texts['force_check_integrity_btn'],
+            command=lambda: self.check_file_integrity(force_rehash=True)
+        )
+        self.repair_button.bind('<Button-3>', self._show_repair_menu)
+
         # --- Log Section ---
         self.log_frame = ttk.LabelFrame(self.root, text=self.texts['log_section'], style='Main.TLabelframe')
         self.log_frame.grid(row=3, column=0, sticky='nsew', **padding)
@@ -294,9 +322,27 @@ class DownloaderGUI:
         sb.grid(row=0, column=1, sticky='ns')
         self.log_text.config(yscrollcommand=sb.set)
 
+    def _show_repair_menu(self, event):
+        # While a check runs the button cancels it, so no second check may start
+        if self.app_state != 0 or str(self.repair_button['state']) == 'disabled':
+            return
+        try:
+            self.repair_menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            self.repair_menu.grab_release()
+
     def _on_path_changed(self, *args):
         self.game_config.path = self.path_var.get()
         self.config_wrapper.save()
+        if not self.app_config.silentMode:
+            self.core.watch_game_state(self._on_game_state_changed)
+
+    def _on_game_state_changed(self, old_state, new_state):
+        # Called from the watcher thread
+        old_flag = old_state.StateFlag if old_state else None
+        new_flag = new_state.StateFlag if new_state else None
+        if old_flag != new_flag:
+            self.log(self.texts['state_changed'].format(old=old_flag, new=new_flag))
 
     def _on_version_changed(self, *args):
         self.download_config.targetVersion = self.version_var.get()
@@ -317,6 +363,7 @@ class DownloaderGUI:
             self.texts['exit_msg']):
                 self.core.stop()
                 self.root.destroy()
+                self.config_wrapper.flush()
                 os._exit(0)
 
     def show_compact_ui(self):
@@ -338,68 +385,113 @@ class DownloaderGUI:
     def exit_and_launch(self):
         self.core.launch_game()
         self.root.destroy()
+        self.config_wrapper.flush()
         os._exit(0)
 
-    def monitor_game_status(self):
-        if self.app_config.silentMode and not hasattr(self, 'launch_button'):
-            self.root.after(2000, self.monitor_game_status)
+    def _on_game_process_event(self, event):
+        if event.kind == "exit":
+            self.log(self.texts['game_exited'].format(pid=event.pid, code=event.exit_code, duration=format_eta(event.duration)))
+        self.root.after(0, self.update_game_status)
+
+    def update_game_status(self):
+        if not hasattr(self, 'launch_button'):
             return
 
-        try:
-            is_running = self.core.is_game_running()
-            
-            if not self.app_config.unlimitLaunchGame and is_running:
-                if self.launch_button['text'] != self.texts['game_running']:
-                    self.launch_button.config(text=self.texts['game_running'])
-                    self.set_controls_state(False)
-            else:
-                if self.launch_button['text'] == self.texts['game_running']:
-                    self.launch_button.config(text=self.texts['launch_btn'])
-                    
-                    is_task_running = (self.core.download_thread and not self.core.download_thread.done()) or \
-                                     (self.repair_button['text'] == self.texts['initializing'])
-                                     
-                    if not is_task_running:
-                        self.set_controls_state(True)
-        finally:
-            self.root.after(2000, self.monitor_game_status)
+        is_running = self.core.is_game_running()
+        
+        if not self.app_config.unlimitLaunchGame and is_running:
+            if self.launch_button['text'] != self.texts['game_running']:
+                self.launch_button.config(text=self.texts['game_running'])
+                self.set_controls_state(False)
+        else:
+            if self.launch_button['text'] == self.texts['game_running']:
+                self.launch_button.config(text=self.texts['launch_btn'])
+                
+                is_task_running = (self.core.download_thread and not self.core.download_thread.done()) or \
+                                 (self.repair_button['text'] in (self.texts['initializing'], self.texts['cancel_check_btn']))
+                                 
+                if not is_task_running:
+                    self.set_controls_state(True)
 
     def log(self, message):
+        # Safe to call from worker threads; deque appends are atomic
         if not self.app_config.silentMode:
-            self.log_text.insert(tk.END, f"{message}\n")
+            self.log_queue.append(message)
+
+    def _flush_log(self):
+        lines = []
+        while self.log_queue:
+            lines.append(self.log_queue.popleft())
+        if lines:
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            # The widget always ends with an empty line after the last newline
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - self.log_max_lines
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
             self.log_text.see(tk.END)
+        self.root.after(LOG_FLUSH_INTERVAL, self._flush_log)
 
     def on_progress(self, data: DownloadProgress):
+        # Called from the progress thread; only the newest snapshot is kept
+        # and at most one apply is queued on the Tk loop at a time
+        self.pending_progress = data
+        if not self.progress_scheduled:
+            self.progress_scheduled = True
+            self.root.after(0, self._apply_progress)
+
+    def _apply_progress(self):
+        self.progress_scheduled = False
+        data = self.pending_progress
+        if data is None or not hasattr(self, 'index_container'):
+            return
         status = data.StateFlags
+        phases = ('indexing',) if status == 3 else ('download', 'build')
+        suffixes = tuple(self._eta_suffix(phase) for phase in phases)
+        if data.visibly_equal(self.applied_progress) and suffixes == self.applied_suffixes:
+            return
+        self.applied_progress = data
+        self.applied_suffixes = suffixes
         if status == 3:
             p = data.ShowDownloadHeadPercent
             r = data.ShowDownloadHeadRateStr
             s = data.ShowDownloadHeadSize
-            sz_str = f"{s / (1024*1024):.2f} MB"
+            sz_str = f"{s / (1024*1024):.2f} MB{suffixes[0]}"
             
             # Switch visibility: Indexing only
-            self.root.after(0, lambda: self.index_container.pack(fill='x', pady=5))
-            self.root.after(0, self.download_container.pack_forget)
-            self.root.after(0, self.build_container.pack_forget)
+            if self.progress_layout != 'index':
+                self.progress_layout = 'index'
+                self.index_container.pack(fill='x', pady=5)
+                self.download_container.pack_forget()
+                self.build_container.pack_forget()
             
-            self.root.after(0, lambda: self.update_index_ui(p, r, sz_str))
+            self.update_index_ui(p, r, sz_str)
         elif 4 <= status <= 8:
             dp = data.ShowDownloadPercent
             dr = data.ShowDownloadRateStr
             ds = data.ShowDownloadSize
-            ds_str = f"{ds / (1024*1024):.2f} MB"
+            ds_str = f"{ds / (1024*1024):.2f} MB{suffixes[0]}"
             
             bp = data.ShowBuildPercent
             br = data.ShowBuildRateStr
             bs = data.ShowBuildSize
-            bs_str = f"{bs / (1024*1024):.2f} MB"
+            bs_str = f"{bs / (1024*1024):.2f} MB{suffixes[1]}"
 
             # Switch visibility: Download & Build
-            self.root.after(0, self.index_container.pack_forget)
-            self.root.after(0, lambda: self.download_container.pack(fill='x', pady=5))
-            self.root.after(0, lambda: self.build_container.pack(fill='x', pady=5))
+            if self.progress_layout != 'main':
+                self.progress_layout = 'main'
+                self.index_container.pack_forget()
+                self.download_container.pack(fill='x', pady=5)
+                self.build_container.pack(fill='x', pady=5)
             
-            self.root.after(0, lambda: self.update_main_ui(dp, dr, ds_str, bp, br, bs_str))
+            self.update_main_ui(dp, dr, ds_str, bp, br, bs_str)
+
+    def _eta_suffix(self, phase):
+        stats = self.core.progress_history.stats(phase)
+        if stats.stalled:
+            return self.texts['stalled_suffix']
+        if stats.eta is None or stats.percent >= 1.0:
+            return ""
+        return self.texts['eta_suffix'].format(eta=format_eta(stats.eta))
 
     def update_index_ui(self, p, r, s):
         self.index_progress['value'] = p * 100
@@ -429,11 +521,11 @@ class DownloaderGUI:
         self.progress_frame.grid(row=2, column=0, sticky='ew', padx=15, pady=5)
         self.core.start_download(on_finished_callback=lambda: self.root.after(0, self.on_finished))
 
-    def check_file_integrity(self):
-        self.app_state = 2
+    def check_file_integrity(self, force_rehash=False, quick=False):
         if not self.game_config.path:
             messagebox.showerror(self.texts['exit_title'], self.texts['path_error'])
             return
+        self.app_state = 2
 
         if self.app_config.silentMode:
             self.show_compact_ui()
@@ -441,7 +533,7 @@ class DownloaderGUI:
         self.version_var.set(self.download_config.originVersion)
         self.download_config.targetVersion = self.download_config.originVersion
         self.set_controls_state(False)
-        self.repair_button.config(text=self.texts['initializing'])
+        self.repair_button.config(text=self.texts['cancel_check_btn'], command=self.cancel_file_integrity, state='normal')
         
         # Show progress UI
         self.progress_frame.grid(row=2, column=0, sticky='ew', padx=15, pady=5)
@@ -454,11 +546,11 @@ class DownloaderGUI:
         def task():
             try:
                 def on_check_progress(curr, total):
-                    p = (curr / total) * 100
+                    p = (curr / total) * 100 if total else 100
                     self.root.after(0, lambda: self.integrity_progress.config(value=p))
                     self.root.after(0, lambda: self.integrity_status.config(text=self.texts['check_progress'].format(curr=curr, total=total, percent=p)))
 
-                repair_file_list = self.core.verify_integrity(progress_callback=on_check_progress)
+                repair_file_list = self.core.verify_integrity(progress_callback=on_check_progress, force_rehash=force_rehash, quick=quick)
                 self.root.after(0, lambda: self._on_integrity_checked(repair_file_list))
             except Exception as e:
                 self.root.after(0, lambda: messagebox.showerror(self.texts['exit_title'], self.texts['check_failed'].format(error=str(e))))
@@ -466,8 +558,16 @@ class DownloaderGUI:
 
         executor.submit(task)
 
+    def cancel_file_integrity(self):
+        self.repair_button.config(text=self.texts['initializing'], state='disabled')
+        self.core.cancel_verify()
+
     def _on_integrity_checked(self, repair_file_list):
         self.progress_frame.grid_forget()
+        if repair_file_list is None:
+            self.log(self.texts['check_cancelled'])
+            self.on_finished()
+            return
         if len(repair_file_list) == 0:
             messagebox.showinfo(self.texts['check_complete_title'], self.texts['check_intact_msg'])
             self.on_finished()
@@ -485,6 +585,7 @@ class DownloaderGUI:
             self.show_compact_ui()
 
         self.set_controls_state(False)
+        self.repair_button.config(text=self.texts['initializing'])
         
         self.progress_frame.grid(row=2, column=0, sticky='ew', padx=15, pady=5)
         self.core.repair_files(
@@ -500,6 +601,10 @@ class DownloaderGUI:
             
         self.set_controls_state(True)
         # Hide progress elements
+        self.pending_progress = None
+        self.applied_progress = None
+        self.applied_suffixes = ()
+        self.progress_layout = None
         self.index_container.pack_forget()
         self.download_container.pack_forget()
         self.build_container.pack_forget()
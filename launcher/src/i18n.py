@@ -17,6 +17,10 @@ I18N = {
         'launch_btn': '启 动 游 戏',
         'game_running': '游戏运行中',
         'check_integrity_btn': '校验完整性',
+        'force_check_integrity_btn': '完整校验（忽略缓存）',
+        'quick_check_integrity_btn': '快速校验（仅检查文件大小）',
+        'cancel_check_btn': '取消校验',
+        'check_cancelled': '校验已取消，下次校验将从中断处继续。',
         'log_section': ' 运行日志 ',
         'checking_version': '正在检查最新版本...',
         'fetch_success': '最新版本获取成功: {version}',
@@ -43,6 +47,10 @@ I18N = {
         'check_failed': '完整性校验失败: {error}',
         'check_progress': '{curr} / {total} ( {percent:.1f}% )',
         'progress_format': '{percent:.1f}% ( {rate} ) - {status}',
+        'eta_suffix': ' - 剩余 {eta}',
+        'stalled_suffix': ' - 已停滞',
+        'state_changed': '下载状态变更: {old} -> {new}',
+        'game_exited': '游戏进程 {pid} 已退出，退出码 {code}，运行时长 {duration}',
         'update_confirm_title': '发现新版本',
         'update_confirm_msg': '检测到新版本，是否立即下载更新？',
         'select_path_title': '选择下载路径'
@@ -64,6 +72,10 @@ I18N = {
         'launch_btn': 'LAUNCH GAME',
         'game_running': 'GAME RUNNING',
         'check_integrity_btn': 'Verify Integrity',
+        'force_check_integrity_btn': 'Full Verify (Ignore Cache)',
+        'quick_check_integrity_btn': 'Quick Verify (File Sizes Only)',
+        'cancel_check_btn': 'Cancel Check',
+        'check_cancelled': 'Integrity check cancelled. The next check will resume where it stopped.',
         'log_section': ' Runtime Logs ',
         'checking_version': 'Checking for latest version...',
         'fetch_success': 'Latest version fetched: {version}',
@@ -90,6 +102,10 @@ I18N = {
         'check_failed': 'Integrity check failed: {error}',
         'check_progress': '{curr} / {total} ( {percent:.1f}% )',
         'progress_format': '{percent:.1f}% ( {rate} ) - {status}',
+        'eta_suffix': ' - {eta} left',
+        'stalled_suffix': ' - stalled',
+        'state_changed': 'Download state changed: {old} -> {new}',
+        'game_exited': 'Game process {pid} exited with code {code} after {duration}',
         'update_confirm_title': 'New Version Found',
         'update_confirm_msg': 'New version detected. Do you want to download and update now?',
         'select_path_title': 'Select Download Path'
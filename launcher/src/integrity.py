@@ -0,0 +1,481 @@
+import os
+import sys
+import json
+import time
+import queue
+import re
+import logging
+import tempfile
+import threading
+import multiprocessing
+
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from hashing import hash_file
+
+VERIFY_INDEX_VERSION = 1
+
+# Spinning disks degrade badly under concurrent random reads, so they get a
+# couple of readers working through path-sorted batches with bigger buffers.
+SSD_READ_CHUNK = 1024 * 1024
+HDD_READ_CHUNK = 4 * 1024 * 1024
+HDD_WORKERS = 2
+HDD_SORT_WINDOW = 1024
+
+# Seconds between verify index flushes during a running check
+CHECKPOINT_INTERVAL = 5.0
+
+# Process engine shards close at whichever limit is reached first
+SHARD_FILES = 64
+SHARD_BYTES = 256 * 1024 * 1024
+
+# A pool that finishes no shard for this long is given up on and the rest is hashed locally
+SHARD_TIMEOUT = 120.0
+
+# How often a process engine waiting on shards rechecks for cancellation
+CANCEL_POLL_INTERVAL = 0.2
+
+# Characters that may follow a complete JSON number
+NUMBER_DELIMITERS = ",}] \t\r\n"
+# What skipping an unneeded manifest value has to stop at, outside and inside strings
+SKIP_STRUCTURE = re.compile(r'["{}\[\]]')
+SKIP_STRING = re.compile(r'["\\]')
+
+class VerifyIndex:
+    # Records size, mtime and md5 of files that already passed verification,
+    # so later checks only rehash files whose stat data changed. It doubles
+    # as the checkpoint of an interrupted check: verified files are flushed
+    # periodically, and a cancelled full rehash is resumed instead of restarted.
+    def __init__(self, base_path: str, content_id: int, downloadable_id):
+        self.path = Path(base_path) / ".dlstorage" / "verifycache" / f"{content_id}_{downloadable_id}.index"
+        self.entries: dict[str, list] = {}
+        self.rehash_pending = False
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+
+    @staticmethod
+    def load(base_path: str, content_id: int, downloadable_id) -> 'VerifyIndex':
+        index = VerifyIndex(base_path, content_id, downloadable_id)
+        if not index.path.exists():
+            return index
+        try:
+            with open(index.path, 'r', encoding='utf-8') as f:
+                data: dict = json.load(f)
+            if data.get("version") == VERIFY_INDEX_VERSION:
+                index.entries = data.get("files", {})
+                index.rehash_pending = data.get("rehash_pending", False)
+        except Exception as e:
+            logging.error(f"Failed to load verify index: {e}")
+        return index
+
+    def lookup(self, name: str, st: os.stat_result, md5: str) -> bool:
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+        return entry[0] == st.st_size and entry[1] == st.st_mtime_ns and entry[2] == md5
+
+    def record(self, name: str, st: os.stat_result, md5: str):
+        with self.lock:
+            self.entries[name] = [st.st_size, st.st_mtime_ns, md5]
+            self.dirty = True
+
+    def discard(self, name: str):
+        with self.lock:
+            if self.entries.pop(name, None) is not None:
+                self.dirty = True
+
+    def begin_rehash(self):
+        # Only drop the recorded hashes if the previous full rehash finished,
+        # otherwise carry on from its checkpoint.
+        with self.lock:
+            if not self.rehash_pending:
+                self.entries = {}
+                self.rehash_pending = True
+            self.dirty = True
+
+    def finish(self):
+        with self.lock:
+            self.dirty = self.dirty or self.rehash_pending
+            self.rehash_pending = False
+
+    def checkpoint(self):
+        if time.monotonic() - self.saved_at >= CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                self.saved_at = time.monotonic()
+                if not self.dirty:
+                    return
+                data = {
+                    "version": VERIFY_INDEX_VERSION,
+                    "rehash_pending": self.rehash_pending,
+                    "files": dict(self.entries)
+                }
+                self.dirty = False
+            tmp_path = self.path.with_suffix(".tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logging.error(f"Failed to save verify index: {e}")
+
+@dataclass(slots=True)
+class ManifestEntry:
+    name: str
+    md5: str
+    size: int | None
+    dir: int
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ManifestEntry':
+        size = data.get("size")
+        return cls(
+            name=data.get("name", ""),
+            md5=data.get("md5", ""),
+            size=int(size) if size is not None else None,
+            dir=data.get("dir", 0)
+        )
+
+class ManifestReader:
+    # Incrementally parses a depotcache manifest and yields its "files"
+    # entries one by one, without loading the whole document.
+    def __init__(self, path: Path, chunk_size: int = 256 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._decoder = json.JSONDecoder()
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self._file = f
+            self._buf = ""
+            self._pos = 0
+            self._eof = False
+            yield from self._parse()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of manifest")
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"Malformed manifest: expected '{char}' at offset {self._pos}")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A value that touches the end of the buffer may be cut short,
+                # and a number cut at "1." or "1e" still decodes as 1, so
+                # numbers also have to be followed by a delimiter
+                if self._eof or (end < len(self._buf) and (
+                        not isinstance(value, (int, float)) or self._buf[end] in NUMBER_DELIMITERS)):
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def _skip(self):
+        # Steps over a value without decoding it. Decoding would restart from
+        # the value's beginning after every refill, which is quadratic for
+        # large values under keys other than "files".
+        if self._peek() not in '{["':
+            self._value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            buf, pos = self._buf, self._pos
+            while True:
+                if in_string:
+                    match = SKIP_STRING.search(buf, pos)
+                    if match is None:
+                        pos = len(buf)
+                        break
+                    if match.group() == "\\":
+                        if match.end() >= len(buf):
+                            # Keep the backslash so the escaped character is seen after the refill
+                            pos = match.start()
+                            break
+                        pos = match.end() + 1
+                        continue
+                    in_string = False
+                    pos = match.end()
+                else:
+                    match = SKIP_STRUCTURE.search(buf, pos)
+                    if match is None:
+                        pos = len(buf)
+                        break
+                    pos = match.end()
+                    char = match.group()
+                    if char == '"':
+                        in_string = True
+                        continue
+                    depth += 1 if char in "{[" else -1
+                if depth == 0 and not in_string:
+                    self._pos = pos
+                    return
+            self._pos = pos
+            if not self._fill():
+                raise ValueError("Unexpected end of manifest")
+
+    def _parse(self):
+        self._expect("{")
+        while (char := self._peek()) != "}":
+            if char == ",":
+                self._pos += 1
+            key = self._value()
+            self._expect(":")
+            if key != "files":
+                self._skip()
+                continue
+            self._expect("[")
+            while (char := self._peek()) != "]":
+                if char == ",":
+                    self._pos += 1
+                item = self._value()
+                if isinstance(item, dict):
+                    self.count += 1
+                    yield ManifestEntry.from_dict(item)
+            self._pos += 1
+
+def is_cancelled(cancel_event: threading.Event = None) -> bool:
+    return cancel_event is not None and cancel_event.is_set()
+
+def until_cancelled(items: Iterable, cancel_event: threading.Event = None):
+    for item in items:
+        if is_cancelled(cancel_event):
+            return
+        yield item
+
+def precheck_entries(base_path: str, entries: Iterable[ManifestEntry], on_resolved: Callable[[str | None], None]):
+    # Cheap stat() pass: flags missing files, and wrong-size files when the
+    # manifest carries sizes, through on_resolved without hashing them.
+    # Entries that still need hashing are yielded together with their stat.
+    base = Path(base_path)
+    for entry in entries:
+        if entry.dir != 0 or not entry.name or not entry.md5:
+            on_resolved(None)
+            continue
+
+        try:
+            st = os.stat(base / entry.name)
+        except OSError:
+            on_resolved(entry.name)
+            continue
+        if entry.size is not None and st.st_size != entry.size:
+            on_resolved(entry.name)
+            continue
+        yield entry, st
+
+class VerifyScheduler:
+    # Streams work items through a bounded queue into a fixed set of reader
+    # threads, so memory stays flat regardless of how many files are queued.
+    def __init__(self, is_ssd: bool = True, workers: int = 0):
+        self.is_ssd = bool(is_ssd)
+        if workers <= 0:
+            workers = min(32, (os.cpu_count() or 1) * 2) if self.is_ssd else HDD_WORKERS
+        self.workers = workers
+        self.chunk_size = SSD_READ_CHUNK if self.is_ssd else HDD_READ_CHUNK
+        self.sort_window = 0 if self.is_ssd else HDD_SORT_WINDOW
+
+    def _batches(self, items: Iterable, key: Callable):
+        if not self.sort_window:
+            yield from items
+            return
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.sort_window:
+                batch.sort(key=key)
+                yield from batch
+                batch = []
+        batch.sort(key=key)
+        yield from batch
+
+    def run(self, items: Iterable, work: Callable, on_result: Callable, key: Callable = None, cancel_event: threading.Event = None):
+        tasks = queue.Queue(maxsize=self.workers * 4)
+        result_lock = threading.Lock()
+        done = object()
+
+        def worker():
+            while True:
+                item = tasks.get()
+                if item is done:
+                    return
+                # Items already queued when the check is cancelled are skipped
+                if is_cancelled(cancel_event):
+                    continue
+                try:
+                    result = work(item)
+                    with result_lock:
+                        on_result(item, result)
+                except Exception as e:
+                    logging.error(f"Verify worker error: {e}")
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        try:
+            ordered = self._batches(items, key) if key else items
+            for item in until_cancelled(ordered, cancel_event):
+                tasks.put(item)
+        finally:
+            for _ in threads:
+                tasks.put(done)
+            for t in threads:
+                t.join()
+
+def verify_files(base_path: str, shard: list[tuple[str, str]], chunk_size: int = SSD_READ_CHUNK) -> list[bool]:
+    base = Path(base_path)
+    results = []
+    for name, md5 in shard:
+        try:
+            results.append(hash_file(base / name, chunk_size=chunk_size) == md5)
+        except Exception:
+            results.append(False)
+    return results
+
+class ProcessVerifyEngine:
+    # Hashes manifest shards in worker processes, keeping hashing off the
+    # shared thread pool used by the servers and the GUI. Workers are spawned
+    # through sys.executable; in the packaged build that is launcher.exe,
+    # which runs the worker when started with --multiprocessing-fork.
+    def __init__(self, processes: int = 0, chunk_size: int = SSD_READ_CHUNK):
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.stalled = False
+
+    def _shards(self, items: Iterable):
+        shard = []
+        shard_bytes = 0
+        for item in items:
+            shard.append(item)
+            shard_bytes += item[1].st_size
+            if len(shard) >= SHARD_FILES or shard_bytes >= SHARD_BYTES:
+                yield shard
+                shard = []
+                shard_bytes = 0
+        if shard:
+            yield shard
+
+    def _deliver(self, shard: list, results: list[bool], on_result: Callable):
+        for item, ok in zip(shard, results):
+            on_result(item, ok)
+
+    def _collect(self, base_path: str, inflight: dict, on_result: Callable, cancel_event: threading.Event = None):
+        deadline = time.monotonic() + SHARD_TIMEOUT
+        while True:
+            done, _ = wait(inflight, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            if done:
+                break
+            if is_cancelled(cancel_event):
+                return
+            if time.monotonic() >= deadline:
+                logging.error(f"No verify process finished a shard in {SHARD_TIMEOUT:.0f}s, hashing the rest locally")
+                self.stalled = True
+                done = set(inflight)
+                break
+        for future in done:
+            shard = inflight.pop(future)
+            try:
+                results = future.result(timeout=0)
+            except Exception as e:
+                if not self.stalled:
+                    logging.error(f"Verify process error, hashing shard locally: {e}")
+                results = verify_files(base_path, [(entry.name, entry.md5) for entry, _ in shard], self.chunk_size)
+            self._deliver(shard, results, on_result)
+
+    def run(self, base_path: str, items: Iterable, on_result: Callable, cancel_event: threading.Event = None):
+        inflight = {}
+        self.stalled = False
+        pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            for shard in self._shards(items):
+                if is_cancelled(cancel_event):
+                    break
+                names = [(entry.name, entry.md5) for entry, _ in shard]
+                try:
+                    if self.stalled:
+                        raise RuntimeError("workers stopped responding")
+                    inflight[pool.submit(verify_files, base_path, names, self.chunk_size)] = shard
+                except Exception as e:
+                    logging.error(f"Verify process pool unavailable, hashing shard locally: {e}")
+                    self._deliver(shard, verify_files(base_path, names, self.chunk_size), on_result)
+                while len(inflight) >= self.processes * 2 and not is_cancelled(cancel_event):
+                    self._collect(base_path, inflight, on_result, cancel_event)
+            while inflight and not is_cancelled(cancel_event):
+                self._collect(base_path, inflight, on_result, cancel_event)
+        finally:
+            if self.stalled or is_cancelled(cancel_event):
+                # Pending shards are dropped, and waiting for running ones
+                # would delay a cancel or hang on workers that never answer
+                pool.terminate_workers()
+            else:
+                pool.shutdown(cancel_futures=True)
+
+def benchmark(file_count: int = 64, file_mb: int = 16):
+    with tempfile.TemporaryDirectory() as tmp:
+        import hashlib
+        items = []
+        block = os.urandom(1024 * 1024)
+        for i in range(file_count):
+            path = Path(tmp) / f"file_{i}.bin"
+            with open(path, 'wb') as f:
+                for _ in range(file_mb):
+                    f.write(block)
+            md5 = hashlib.md5(block * file_mb).hexdigest()
+            items.append((ManifestEntry(path.name, md5, None, 0), path.stat()))
+        total_mb = file_count * file_mb
+
+        def report(label: str, workers: int, elapsed: float, failed: int):
+            print(f"{label:<8} {workers:>3} workers  {elapsed:7.3f} s  {total_mb / elapsed:8.1f} MB/s  failed={failed}")
+
+        counts = sorted({1, 2, 4, 8, 16, os.cpu_count() or 1})
+        for workers in counts:
+            failed = []
+            start = time.perf_counter()
+            VerifyScheduler(True, workers).run(
+                items,
+                lambda item: verify_files(tmp, [(item[0].name, item[0].md5)])[0],
+                lambda item, ok: ok or failed.append(item)
+            )
+            report("thread", workers, time.perf_counter() - start, len(failed))
+        for workers in counts:
+            failed = []
+            start = time.perf_counter()
+            ProcessVerifyEngine(workers).run(tmp, items, lambda item, ok: ok or failed.append(item))
+            report("process", workers, time.perf_counter() - start, len(failed))
+
+if __name__ == '__main__':
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,226 @@
+import time
+import logging
+import threading
+import zmq
+
+from progress import ProgressCoalescer
+
+# Messages taken off the SUB socket per wakeup before control commands are rechecked
+ZMQ_DRAIN_LIMIT = 1000
+# Commands from other threads reach the hub thread through this socket
+ZMQ_CONTROL_ENDPOINT = "inproc://ipc-control"
+# For this long after its session ends, a CID is treated as a straggler of the
+# old process rather than the start of a new session
+RETIRE_GRACE = 5.0
+
+class IpcSession:
+    # One downloadIPC run. The CID is learned from the first message the
+    # process sends after the session is opened.
+    def __init__(self, coalescer: ProgressCoalescer):
+        self.coalescer = coalescer
+        self.cid: bytes = None
+        self.ended = False
+        self.finished = threading.Event()
+        self.stop_ack = threading.Event()
+        self.stop_requested_at = None
+        # Latency of the last stop, from request to IPC acknowledgement and to process exit
+        self.metrics = {"stop_ack_ms": None, "stop_exit_ms": None}
+
+class IpcHub:
+    # Owns the ZMQ context and the two bound sockets for the launcher's
+    # lifetime, so back-to-back download, repair and resume runs don't pay
+    # for setup or hit "address in use". Messages are routed to sessions by
+    # their CID frame; messages from processes of finished sessions are dropped.
+    def __init__(self, sub_port: int, pub_port: int, log_callback: callable = None):
+        self.sub_port = sub_port
+        self.pub_port = pub_port
+        self.log_callback = log_callback
+        self.ctx = None
+        self.thread = None
+        self.sessions: dict[bytes, IpcSession] = {}
+        self.waiting: list[IpcSession] = []
+        self.retired: dict[bytes, float] = {}
+        self.stop_waiters: dict[bytes, IpcSession] = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def log(self, message):
+        logging.info(message)
+        if self.log_callback:
+            self.log_callback(message)
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self.ready.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="ipc-hub")
+        self.thread.start()
+        self.ready.wait(timeout=5)
+
+    def open_session(self, progress_callback: callable, progress_rate: int) -> IpcSession:
+        coalescer = ProgressCoalescer(progress_callback, progress_rate)
+        coalescer.start()
+        session = IpcSession(coalescer)
+        with self.lock:
+            self.waiting.append(session)
+        return session
+
+    def end_session(self, session: IpcSession, process_exited: bool = False):
+        # Once the owner knows the process is gone there can be no stragglers,
+        # so its CID may start a new session right away
+        with self.lock:
+            if session in self.waiting:
+                self.waiting.remove(session)
+            if session.cid is not None:
+                if process_exited:
+                    self.retired.pop(session.cid, None)
+                elif self.sessions.get(session.cid) is session:
+                    self.retired[session.cid] = time.monotonic() + RETIRE_GRACE
+                if self.sessions.get(session.cid) is session:
+                    self.sessions.pop(session.cid)
+            ended, session.ended = session.ended, True
+        if not ended:
+            session.coalescer.close()
+            logging.info(f"Progress messages received: {session.coalescer.received}, published: {session.coalescer.published}")
+        # Set after the final flush, so waiters see the last progress
+        session.finished.set()
+
+    def request_stop(self, session: IpcSession) -> bool:
+        # Wakes the hub thread right away; session.stop_ack is set once the
+        # stop frames have gone out to downloadIPC
+        if session.cid is None:
+            return False
+        session.stop_ack.clear()
+        session.stop_requested_at = time.perf_counter()
+        with self.lock:
+            self.stop_waiters[session.cid] = session
+        return self._send_control([b"stop", session.cid])
+
+    def close(self):
+        if self._send_control([b"close"]) and self.thread:
+            self.thread.join(timeout=5)
+
+    def _send_control(self, command: list[bytes]) -> bool:
+        ctx = self.ctx
+        if ctx is None:
+            return False
+        try:
+            sock = ctx.socket(zmq.PUSH)
+            sock.connect(ZMQ_CONTROL_ENDPOINT)
+            sock.send_multipart(command)
+            sock.close()
+            return True
+        except zmq.ZMQError as e:
+            logging.error(f"Failed to send ZMQ control command: {e}")
+            return False
+
+    def _session_for(self, cid: bytes) -> IpcSession | None:
+        with self.lock:
+            session = self.sessions.get(cid)
+            if session is None and self.waiting and self.retired.get(cid, 0) < time.monotonic():
+                self.retired.pop(cid, None)
+                session = self.waiting.pop(0)
+                session.cid = cid
+                self.sessions[cid] = session
+            return session
+
+    def _send_stop(self, pub_sock, cid: bytes):
+        pub_sock.send_multipart([cid, b"3"])
+        pub_sock.send_multipart([cid, b"3"])
+
+    def _run(self):
+        ctx = zmq.Context()
+        sub_sock = ctx.socket(zmq.SUB)
+        pub_sock = ctx.socket(zmq.PUB)
+        control_sock = ctx.socket(zmq.PULL)
+        try:
+            sub_sock.bind(f"tcp://127.0.0.1:{self.sub_port}")
+            sub_sock.setsockopt_string(zmq.SUBSCRIBE, "")
+            pub_sock.bind(f"tcp://127.0.0.1:{self.pub_port}")
+            control_sock.bind(ZMQ_CONTROL_ENDPOINT)
+        except zmq.ZMQError as e:
+            self.log(f"ZMQ Server Error: {e}")
+            for sock in (sub_sock, pub_sock, control_sock):
+                sock.close()
+            ctx.term()
+            self.ready.set()
+            return
+
+        self.ctx = ctx
+        self.ready.set()
+        poller = zmq.Poller()
+        poller.register(sub_sock, zmq.POLLIN)
+        poller.register(control_sock, zmq.POLLIN)
+        self.log("ZMQ server started.")
+
+        try:
+            while True:
+                socks = dict(poller.poll())
+                if control_sock in socks:
+                    command = control_sock.recv_multipart()
+                    if command[0] == b"close":
+                        break
+                    if command[0] == b"stop":
+                        self._handle_stop(pub_sock, command[1])
+
+                if sub_sock in socks:
+                    self._drain(sub_sock, pub_sock)
+        except Exception as e:
+            self.log(f"ZMQ Server Error: {e}")
+        finally:
+            self.ctx = None
+            with self.lock:
+                sessions = list(self.sessions.values()) + self.waiting
+            for session in sessions:
+                self.end_session(session)
+            control_sock.close()
+            sub_sock.close()
+            pub_sock.close()
+            ctx.term()
+            self.log("ZMQ server stopped.")
+
+    def _handle_stop(self, pub_sock, cid: bytes):
+        # The session may already have ended while its process lingers, so
+        # the stop goes out regardless
+        with self.lock:
+            session = self.stop_waiters.pop(cid, None)
+        self._send_stop(pub_sock, cid)
+        if session is None:
+            return
+        session.metrics["stop_ack_ms"] = (time.perf_counter() - session.stop_requested_at) * 1000
+        session.stop_ack.set()
+        self.log("Sent stop signal to IPC via ZMQ.")
+        self.end_session(session)
+
+    def _drain(self, sub_sock, pub_sock):
+        # Drain everything already queued; progress is only decoded for the
+        # newest message of each state when it is published
+        for _ in range(ZMQ_DRAIN_LIMIT):
+            try:
+                parts = sub_sock.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            if len(parts) != 3: continue
+
+            cid = parts[0]
+            session = self._session_for(cid)
+            if session is None:
+                continue
+            try:
+                m_type_str = parts[1].decode('utf-8', errors='replace')
+                m_type = int(m_type_str) if m_type_str.isdigit() else 0
+            except Exception: continue
+
+            if m_type == 10 and parts[2] == b"heartbeat":
+                pub_sock.send_multipart([cid, b"4"])
+                continue
+            elif 3 <= m_type <= 8:
+                session.coalescer.submit(m_type, parts[2])
+
+            if 8 <= m_type < 2000:
+                self._send_stop(pub_sock, cid)
+                self.log(f"Received stop signal from IPC (type {m_type})")
+                self.end_session(session)
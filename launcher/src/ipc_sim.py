@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import subprocess
+import zmq
+
+from pathlib import Path
+
+# Stand-in for downloadIPC.exe speaking the same ZMQ protocol, so the IPC path
+# of DownloaderCore can be exercised and measured on any platform.
+#
+#   python ipc_sim.py peer         run a fake downloader until told to stop
+#   python ipc_sim.py stop-check   measure DownloaderCore.stop() against it
+#   python ipc_sim.py bench        measure throughput and latency of the IPC path
+
+DEFAULT_CID = b"fake-ipc"
+DEFAULT_RATE = 20.0
+HEARTBEAT_INTERVAL = 1.0
+# Share of the messages sent in the indexing phase (type 3) before downloading (type 4)
+INDEX_SHARE = 0.1
+# PUB drops everything sent before the connection is up, so the peer waits this long first
+CONNECT_DELAY = 0.2
+
+class FakeDownloadIPC:
+    # Publishes heartbeats and progress on pubport at `rate` messages per
+    # second and exits when the launcher answers with a stop ([cid, b"3"]) on
+    # subport. With a duration it finishes on its own with a type 8 message.
+    # Each message carries its sequence number in the size fields, and
+    # sent_at[seq] records when it went out.
+    def __init__(self, pubport: int = 32569, subport: int = 32568, cid: bytes = DEFAULT_CID, rate: float = DEFAULT_RATE):
+        self.pubport = pubport
+        self.subport = subport
+        self.cid = cid
+        self.rate = rate
+        self.sent_at: list[float] = []
+
+    def progress(self, seq: int, state: int, percent: float) -> bytes:
+        return json.dumps({
+            "StateFlags": state,
+            "ShowDownloadHeadRate": 1024.0 * 1024,
+            "ShowDownloadHeadRateStr": "1.00 MB/s",
+            "ShowDownloadHeadSize": seq,
+            "ShowDownloadHeadPercent": percent,
+            "ShowDownloadRate": 1024.0 * 1024,
+            "ShowDownloadRateStr": "1.00 MB/s",
+            "ShowDownloadSize": seq,
+            "ShowDownloadPercent": percent
+        }).encode('utf-8')
+
+    def _send_progress(self, pub_sock, state: int, percent: float):
+        seq = len(self.sent_at)
+        self.sent_at.append(time.perf_counter())
+        pub_sock.send_multipart([self.cid, str(state).encode(), self.progress(seq, state, percent)])
+
+    def _stopped(self, sub_sock) -> bool:
+        cid, m_type = sub_sock.recv_multipart()[:2]
+        return cid == self.cid and m_type == b"3"
+
+    def run(self, duration: float = None) -> str:
+        ctx = zmq.Context()
+        pub_sock = ctx.socket(zmq.PUB)
+        pub_sock.connect(f"tcp://127.0.0.1:{self.pubport}")
+        sub_sock = ctx.socket(zmq.SUB)
+        sub_sock.connect(f"tcp://127.0.0.1:{self.subport}")
+        sub_sock.setsockopt(zmq.SUBSCRIBE, b"")
+        poller = zmq.Poller()
+        poller.register(sub_sock, zmq.POLLIN)
+        time.sleep(CONNECT_DELAY)
+
+        interval = 1.0 / self.rate
+        start = time.perf_counter()
+        next_send = next_heartbeat = start
+        deadline = start + duration if duration else None
+        try:
+            while True:
+                now = time.perf_counter()
+                if deadline and now >= deadline:
+                    self._send_progress(pub_sock, 8, 1.0)
+                    while poller.poll(timeout=2000):
+                        if self._stopped(sub_sock):
+                            return "finished"
+                    return "timeout"
+                if now >= next_heartbeat:
+                    pub_sock.send_multipart([self.cid, b"10", b"heartbeat"])
+                    next_heartbeat += HEARTBEAT_INTERVAL
+                # Messages that fell due while sleeping go out as a burst
+                while next_send <= now:
+                    percent = min((now - start) / duration, 1.0) if duration else 0.5
+                    self._send_progress(pub_sock, 3 if percent < INDEX_SHARE else 4, percent)
+                    next_send += interval
+                timeout = max(0.0, min(next_send, next_heartbeat) - time.perf_counter())
+                if poller.poll(timeout=int(timeout * 1000)) and self._stopped(sub_sock):
+                    return "stopped"
+        finally:
+            pub_sock.close(linger=0)
+            sub_sock.close(linger=0)
+            ctx.term()
+
+def stop_check(rounds: int = 5) -> list[dict]:
+    # Runs the fake peer as a real subprocess and stops it through
+    # DownloaderCore.stop(), as the GUI's close button does
+    from config import ConfigWrapper
+    from core import DownloaderCore
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        config = ConfigWrapper.load(Path(tmp) / "config.json")
+        for _ in range(rounds):
+            core = DownloaderCore(Path(tmp), config)
+            core.stop_event.clear()
+            core.start_zmq_server()
+            core.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "peer", "--rate", "20"])
+            deadline = time.monotonic() + 10
+            while core.last_cid is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert core.last_cid == DEFAULT_CID, "fake peer never connected"
+
+            process = core.process
+            core.stop()
+            assert process.poll() is not None, "fake peer still running"
+            results.append(dict(core.ipc_metrics))
+    return results
+
+def benchmark(rate: float, duration: float, progress_rate: int) -> dict:
+    # Runs the fake peer on a thread of this process, so send and receive
+    # times share a clock, and drives DownloaderCore's real IPC path. Latency
+    # is measured from send to the progress callback for published messages.
+    from config import ConfigWrapper
+    from core import DownloaderCore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = ConfigWrapper.load(Path(tmp) / "config.json")
+        config.appConfig.progressRate = progress_rate
+        latencies = []
+        peer = FakeDownloadIPC(config.downloadConfig.pubport, config.downloadConfig.subport, rate=rate)
+
+        def on_progress(progress):
+            latencies.append(time.perf_counter() - peer.sent_at[progress.ShowDownloadSize])
+
+        core = DownloaderCore(Path(tmp), config, progress_callback=on_progress)
+        core.stop_event.clear()
+        core.start_zmq_server()
+        session = core.ipc_session
+        outcome = peer.run(duration)
+        session.finished.wait(timeout=5)
+        elapsed = time.perf_counter() - peer.sent_at[0]
+        core.stop()
+
+    sent = len(peer.sent_at)
+    received = session.coalescer.received
+    latencies.sort()
+    return {
+        "outcome": outcome,
+        "sent": sent,
+        "received": received,
+        "published": session.coalescer.published,
+        "lost": sent - received,
+        "coalesced": received - session.coalescer.published,
+        "messages_per_s": received / elapsed,
+        "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["peer", "stop-check", "bench"])
+    parser.add_argument("--pubport", type=int, default=32569)
+    parser.add_argument("--subport", type=int, default=32568)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="progress messages per second")
+    parser.add_argument("--duration", type=float, default=3.0, help="bench: seconds of traffic")
+    parser.add_argument("--progress-rate", type=int, default=20, help="bench: appConfig.progressRate")
+    args = parser.parse_args()
+
+    if args.mode == "peer":
+        FakeDownloadIPC(args.pubport, args.subport, rate=args.rate).run()
+        return
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.mode == "bench":
+        result = benchmark(args.rate, args.duration, args.progress_rate)
+        print(f"outcome     {result['outcome']}")
+        print(f"sent        {result['sent']}  received {result['received']}  published {result['published']}")
+        print(f"dropped     {result['lost']} lost in transport, {result['coalesced']} coalesced")
+        print(f"throughput  {result['messages_per_s']:.0f} messages/s")
+        print(f"latency     p50 {result['latency_p50_ms']:.1f} ms  p95 {result['latency_p95_ms']:.1f} ms  max {result['latency_max_ms']:.1f} ms")
+        return
+
+    for result in stop_check():
+        print(f"stop ack {result['stop_ack_ms']:6.1f} ms   stop to exit {result['stop_exit_ms']:7.1f} ms")
+        # The old 100 ms poll alone could add up to 100 ms before the stop was sent
+        assert result["stop_ack_ms"] < 100, "stop request was not picked up immediately"
+
+if __name__ == '__main__':
+    main()
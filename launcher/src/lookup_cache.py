@@ -0,0 +1,110 @@
+import os
+import copy
+import json
+import time
+import logging
+import threading
+import requests
+
+from pathlib import Path
+from collections import OrderedDict
+from net import request_get, is_offline
+
+DEFAULT_TTL = 600
+DEFAULT_MAX_ENTRIES = 256
+# When a stale answer is at hand and the caller prefers the cache, the
+# network only gets one short attempt before falling back to it.
+FAST_FAIL_TIMEOUT = 3
+
+class LookupCache:
+    # Persistent TTL cache of successful API responses with LRU eviction.
+    # Expired entries are kept as an offline fallback until evicted.
+    def __init__(self, path: Path = None, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefer_cache = False
+        self.entries: OrderedDict[str, list] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def configure(self, path: Path, ttl: int = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES, prefer_cache: bool = False):
+        with self.lock:
+            self.path = path
+            self.ttl = ttl
+            self.max_entries = max(1, max_entries)
+            self.prefer_cache = prefer_cache
+            self.entries = OrderedDict()
+            try:
+                if path and path.exists():
+                    with open(path, 'r', encoding='utf-8') as f:
+                        self.entries.update(json.load(f))
+            except Exception as e:
+                logging.error(f"Failed to load lookup cache: {e}")
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path.with_suffix(".tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to save lookup cache: {e}")
+
+    def get(self, key: str, allow_stale: bool = False):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if not allow_stale and time.time() - stored_at > self.ttl:
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value):
+        with self.lock:
+            self.entries[key] = [time.time(), value]
+            self.entries.move_to_end(key)
+            self._evict()
+            self._save()
+
+    def fetch(self, key: str, func):
+        # func(fast_fail) returns the fresh value or None on failure
+        value = self.get(key)
+        if value is not None:
+            return value
+        stale = self.get(key, allow_stale=True)
+        value = func(stale is not None and self.prefer_cache)
+        if value is not None:
+            self.put(key, value)
+            return value
+        if stale is not None:
+            logging.info(f"Using cached response for {key}")
+        return stale
+
+lookup_cache = LookupCache()
+
+def cached_get(url: str, params: dict = None, cancel_event: threading.Event = None) -> dict:
+    # request_get through the lookup cache; only successful API answers are stored
+    key = requests.Request("GET", url, params=params).prepare().url
+
+    def fetch(fast_fail: bool):
+        if fast_fail and is_offline():
+            return None
+        if fast_fail:
+            data = request_get(url, params=params, retries=1, timeout=FAST_FAIL_TIMEOUT, cancel_event=cancel_event)
+        else:
+            data = request_get(url, params=params, cancel_event=cancel_event)
+        if data is not None and data.get("code") == 200:
+            return data
+        return None
+
+    # Callers may modify the response, so they never get the cached object itself
+    return copy.deepcopy(lookup_cache.fetch(key, fetch))
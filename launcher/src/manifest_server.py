@@ -1,58 +1,504 @@
+import os
+import re
+import copy
+import gzip
+import json
+import time
+import socket
+import asyncio
 import logging
+import threading
 
-from flask import Flask, jsonify, request
-from utils import request_get
+from pathlib import Path
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from flask import Flask, jsonify, request, send_file, abort
+from lookup_cache import cached_get
+from net import http
 
 app = Flask(__name__)
 manifest_url_api = "https://loadingbaycn.webapp.163.com/app/v1/file_distribution_v2/manifest_url"
 
-@app.route('/app/v1/file_distribution_v2/manifest_url', methods=['GET'])
-def get_manifest():
-    app_content_id = request.args.get('app_content_id')
-    target_version = request.args.get('target_version')
-    downloadable_id = int(target_version.split("_")[1]) if target_version and "_" in target_version else None
+MANIFEST_ROUTE = '/app/v1/file_distribution_v2/manifest_url'
+MIRROR_ROUTE = re.compile(r'^/manifest/(\d+)\.manifest$')
+STATS_ROUTE = '/launcher/manifest_stats'
+MIRROR_DOWNLOAD_TIMEOUT = 60
+
+RESPONSE_TTL = 300
+RESPONSE_CACHE_SIZE = 64
+# Async server: concurrent upstream resolutions and idle keep-alive timeout
+UPSTREAM_CONCURRENCY = 4
+KEEPALIVE_TIMEOUT = 30
+
+MANIFEST_ERROR = {
+    "code": 500,
+    "msg": "Failed to get manifest URL"
+}
+
+class ResponseCache:
+    # Short-lived cache of resolved manifest answers. Concurrent requests for
+    # the same key share a single upstream resolution.
+    def __init__(self, ttl: int = RESPONSE_TTL, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: dict[tuple, tuple[float, dict]] = {}
+        self.inflight: dict[tuple, Future] = {}
+        self.lock = threading.Lock()
+
+    def _store(self, key: tuple, payload: dict):
+        now = time.monotonic()
+        with self.lock:
+            self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+            self.entries[key] = (now + self.ttl, payload)
+            while len(self.entries) > self.max_entries:
+                self.entries.pop(next(iter(self.entries)))
+
+    def peek(self, key: tuple) -> dict | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+
+    def get(self, key: tuple, resolve) -> dict:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.inflight[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            payload = resolve()
+            if payload.get("code") == 200:
+                self._store(key, payload)
+            future.set_result(payload)
+            return payload
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+response_cache = ResponseCache()
+
+class StrategyStats:
+    # Per-strategy attempts, hits and latency, to see which lookup actually
+    # serves our versions. "served" counts the answers that were returned.
+    def __init__(self):
+        self.stats: dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def _entry(self, name: str) -> dict:
+        return self.stats.setdefault(name, {"attempts": 0, "hits": 0, "served": 0, "total_latency": 0.0, "last_latency": 0.0})
+
+    def record(self, name: str, hit: bool, latency: float):
+        with self.lock:
+            entry = self._entry(name)
+            entry["attempts"] += 1
+            entry["hits"] += int(hit)
+            entry["total_latency"] += latency
+            entry["last_latency"] = latency
+
+    def served(self, name: str):
+        with self.lock:
+            self._entry(name)["served"] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                name: {
+                    "attempts": entry["attempts"],
+                    "hits": entry["hits"],
+                    "served": entry["served"],
+                    "hit_rate": round(entry["hits"] / entry["attempts"], 3) if entry["attempts"] else 0.0,
+                    "avg_latency_ms": round(entry["total_latency"] / entry["attempts"] * 1000, 1) if entry["attempts"] else 0.0,
+                    "last_latency_ms": round(entry["last_latency"] * 1000, 1)
+                }
+                for name, entry in self.stats.items()
+            }
 
-    # format 1: by target_version
+strategy_stats = StrategyStats()
+# Set from DownloadConfig.raceManifestStrategies at server start
+race_strategies = False
+strategy_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="manifest")
+
+def fallback_manifest_url(downloadable_id: int) -> str:
+    return f"https://x19-h.gdl.netease.com/a50_package__v2_i_81_{downloadable_id}/v2_569_{downloadable_id}.manifest"
+
+def _by_version(app_content_id: str, target_version: str, downloadable_id: int, cancel_event: threading.Event = None) -> tuple[bool, dict]:
+    # format 1: by target_version. Any successful answer doubles as the
+    # template for format 3, so it is returned even when it is not a hit.
     params = {
         "app_content_id": app_content_id,
         "target_version": target_version
     }
-    manifest_data = request_get(manifest_url_api, params=params)
-    if manifest_data is not None and manifest_data.get("code") == 200:
-        manifest_data_data = manifest_data.get("data", {})
-        target_downloadable_id = manifest_data_data.get("downloadable_id")
-        if target_downloadable_id is not None and target_downloadable_id == downloadable_id:
-            logging.info(f"Found manifest for version {target_version}")
-            return jsonify(manifest_data), 200
-    else:
-        logging.error(f"No manifest found for app_content_id {app_content_id}")
-        return jsonify({
-            "code": 500,
-            "msg": "Failed to get manifest URL"
-        }), 200
-    manifest_template = manifest_data
-    
+    manifest_data = cached_get(manifest_url_api, params=params, cancel_event=cancel_event)
+    if manifest_data is None or manifest_data.get("code") != 200:
+        return False, None
+    target_downloadable_id = manifest_data.get("data", {}).get("downloadable_id")
+    return target_downloadable_id is not None and target_downloadable_id == downloadable_id, manifest_data
+
+def _by_downloadable_id(app_content_id: str, downloadable_id: int, cancel_event: threading.Event = None) -> tuple[bool, dict]:
     # format 2: by downloadable_id
     params = {
         "app_content_id": app_content_id,
         "target_downloadable_id": downloadable_id
     }
-    manifest_data = request_get(manifest_url_api, params=params)
+    manifest_data = cached_get(manifest_url_api, params=params, cancel_event=cancel_event)
     if manifest_data is not None and manifest_data.get("code") == 200:
+        return True, manifest_data
+    return False, None
+
+def _constructed(downloadable_id: int) -> tuple[bool, str]:
+    # format 3: the CDN URL built from downloadable_id, verified with a HEAD
+    url = fallback_manifest_url(downloadable_id)
+    return http.exists(url), url
+
+def _timed(name: str, func, *args) -> tuple[bool, object]:
+    start = time.perf_counter()
+    hit, result = False, None
+    try:
+        hit, result = func(*args)
+    except Exception as e:
+        logging.error(f"Manifest strategy {name} failed: {e}")
+    strategy_stats.record(name, hit, time.perf_counter() - start)
+    return hit, result
+
+def _from_template(template: dict, downloadable_id: int) -> dict:
+    template["data"]["manifest_url"] = fallback_manifest_url(downloadable_id)
+    template["data"]["downloadable_id"] = downloadable_id
+    return template
+
+def resolve_manifest(app_content_id: str, target_version: str) -> dict:
+    downloadable_id = int(target_version.split("_")[1]) if target_version and "_" in target_version else None
+    if race_strategies and downloadable_id:
+        return race_manifest(app_content_id, target_version, downloadable_id)
+
+    hit, manifest_template = _timed("by_version", _by_version, app_content_id, target_version, downloadable_id)
+    if hit:
+        logging.info(f"Found manifest for version {target_version}")
+        strategy_stats.served("by_version")
+        return manifest_template
+    if manifest_template is None:
+        logging.error(f"No manifest found for app_content_id {app_content_id}")
+        return MANIFEST_ERROR
+
+    hit, manifest_data = _timed("by_downloadable_id", _by_downloadable_id, app_content_id, downloadable_id)
+    if hit:
         logging.info(f"Found manifest for downloadable_id {downloadable_id}")
-        return jsonify(manifest_data), 200
-    
-    # format 3: fallback to construct manifest URL
+        strategy_stats.served("by_downloadable_id")
+        return manifest_data
+
     if not downloadable_id:
         logging.error("Missing downloadable_id for fallback manifest URL construction")
-        return jsonify({
-            "code": 500,
-            "msg": "Failed to get manifest URL"
-        }), 200
+        return MANIFEST_ERROR
     logging.info(f"Fallback to construct manifest URL for downloadable_id {downloadable_id}")
-    manifest_template["data"]["manifest_url"] = f"https://x19-h.gdl.netease.com/a50_package__v2_i_81_{downloadable_id}/v2_569_{downloadable_id}.manifest"
-    manifest_template["data"]["downloadable_id"] = downloadable_id
-    return jsonify(manifest_template), 200
+    strategy_stats.served("constructed")
+    return _from_template(manifest_template, downloadable_id)
+
+def race_manifest(app_content_id: str, target_version: str, downloadable_id: int) -> dict:
+    # All three strategies start at once and the first valid answer wins.
+    # The constructed URL only counts once its HEAD succeeds and format 1 has
+    # supplied a template. Losers are cancelled: queued lookups never start
+    # and running ones stop before their next retry.
+    cancel_event = threading.Event()
+    futures = {
+        strategy_executor.submit(_timed, "by_version", _by_version, app_content_id, target_version, downloadable_id, cancel_event): "by_version",
+        strategy_executor.submit(_timed, "by_downloadable_id", _by_downloadable_id, app_content_id, downloadable_id, cancel_event): "by_downloadable_id",
+        strategy_executor.submit(_timed, "constructed", _constructed, downloadable_id): "constructed"
+    }
+    template = None
+    constructed_ok = False
+    winner, payload = None, None
+    try:
+        for future in as_completed(futures):
+            name = futures[future]
+            hit, result = future.result()
+            if name == "by_version" and result is not None:
+                template = result
+            elif name == "constructed":
+                constructed_ok = hit
+            if hit and name != "constructed":
+                winner, payload = name, result
+                break
+            if constructed_ok and template is not None:
+                winner, payload = "constructed", _from_template(template, downloadable_id)
+                break
+    finally:
+        cancel_event.set()
+        for future in futures:
+            future.cancel()
+
+    if winner is None:
+        logging.error(f"No manifest found for app_content_id {app_content_id}")
+        return MANIFEST_ERROR
+    logging.info(f"Manifest for version {target_version} served by {winner}")
+    strategy_stats.served(winner)
+    return payload
+
+class ManifestMirror:
+    # Keeps one local copy of each manifest body, content-addressed by
+    # downloadable_id, and points manifest_url answers at it so downloadIPC
+    # does not fetch the same multi-MB manifest again on every resume/repair.
+    def __init__(self):
+        self.enabled = False
+        self.root: Path = None
+        self.base_url = ""
+        self.locks: dict[int, threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    def configure(self, root: Path, base_url: str, enabled: bool = True):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.enabled = enabled
+
+    def path_for(self, downloadable_id: int) -> Path:
+        return self.root / f"{downloadable_id}.manifest"
+
+    def gzip_path_for(self, downloadable_id: int) -> Path:
+        return self.root / f"{downloadable_id}.manifest.gz"
+
+    def _download(self, url: str, downloadable_id: int) -> bool:
+        path = self.path_for(downloadable_id)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with http.session().get(url, stream=True, timeout=MIRROR_DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+            with open(tmp_path, 'rb') as src, gzip.open(self.gzip_path_for(downloadable_id), 'wb') as dst:
+                while chunk := src.read(1024 * 1024):
+                    dst.write(chunk)
+            os.replace(tmp_path, path)
+            logging.info(f"Mirrored manifest {downloadable_id} from {url}")
+            return True
+        except Exception as e:
+            logging.error(f"Failed to mirror manifest {downloadable_id}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return False
+
+    def localize(self, payload: dict) -> dict:
+        # Returns the payload with manifest_url pointing at the local copy,
+        # downloading it first if needed; unchanged if mirroring fails.
+        if not self.enabled or payload.get("code") != 200:
+            return payload
+        data = payload.get("data") or {}
+        url = data.get("manifest_url")
+        downloadable_id = data.get("downloadable_id")
+        if not url or not isinstance(downloadable_id, int):
+            return payload
+
+        with self.lock:
+            lock = self.locks.setdefault(downloadable_id, threading.Lock())
+        with lock:
+            if not self.path_for(downloadable_id).exists() and not self._download(url, downloadable_id):
+                return payload
+        payload = copy.deepcopy(payload)
+        payload["data"]["manifest_url"] = f"{self.base_url}/manifest/{downloadable_id}.manifest"
+        return payload
+
+manifest_mirror = ManifestMirror()
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    # Single "bytes=start-end" range, returned as an inclusive (start, end)
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+def get_manifest_response(app_content_id: str, target_version: str) -> dict:
+    return response_cache.get(
+        (app_content_id, target_version),
+        lambda: resolve_manifest(app_content_id, target_version)
+    )
+
+@app.route(MANIFEST_ROUTE, methods=['GET'])
+def get_manifest():
+    app_content_id = request.args.get('app_content_id')
+    target_version = request.args.get('target_version')
+    payload = manifest_mirror.localize(get_manifest_response(app_content_id, target_version))
+    return jsonify(payload), 200
+
+@app.route(STATS_ROUTE, methods=['GET'])
+def get_strategy_stats():
+    return jsonify(strategy_stats.snapshot()), 200
+
+@app.route('/manifest/<int:downloadable_id>.manifest', methods=['GET'])
+def get_mirrored_manifest(downloadable_id: int):
+    path = manifest_mirror.path_for(downloadable_id) if manifest_mirror.root else None
+    if path is None or not path.exists():
+        abort(404)
+    gzip_path = manifest_mirror.gzip_path_for(downloadable_id)
+    if 'gzip' in request.accept_encodings and 'Range' not in request.headers and gzip_path.exists():
+        response = send_file(gzip_path, mimetype='application/octet-stream')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    return send_file(path, mimetype='application/octet-stream', conditional=True)
+
+class AsyncManifestServer:
+    # asyncio alternative to the werkzeug dev server for the manifest route.
+    # Requests are served concurrently and upstream resolutions, which block
+    # on HTTP, run in worker threads behind a concurrency limit. Exposes the
+    # same serve_forever()/shutdown() pair as werkzeug's make_server.
+    def __init__(self, host: str, port: int, upstream_limit: int = UPSTREAM_CONCURRENCY):
+        # Bind now so that an occupied port fails at construction, as with make_server
+        self.sock = socket.create_server((host, port))
+        self.upstream_limit = upstream_limit
+        self.loop = None
+        self.stopped = None
+        self.closed = threading.Event()
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.closed.set()
+
+    def shutdown(self):
+        if self.loop is None:
+            self.sock.close()
+            return
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.closed.wait(timeout=5)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.semaphore = asyncio.Semaphore(self.upstream_limit)
+        self.pending: dict[tuple, asyncio.Future] = {}
+        self.writers: set[asyncio.StreamWriter] = set()
+        server = await asyncio.start_server(self._handle, sock=self.sock)
+        async with server:
+            await self.stopped.wait()
+            # Since 3.12 leaving the block waits for every connection, so idle
+            # keep-alive clients (a browser on the stats route) are dropped
+            for writer in list(self.writers):
+                writer.close()
+
+    async def _dispatch(self, method: str, target: str, headers: dict) -> tuple[int, dict, bytes]:
+        url = urlsplit(target)
+        mirrored = MIRROR_ROUTE.match(url.path)
+        if mirrored and method == "GET":
+            return await self.loop.run_in_executor(None, self._mirrored_manifest, int(mirrored.group(1)), headers)
+        if url.path == STATS_ROUTE and method == "GET":
+            body = (json.dumps(strategy_stats.snapshot(), separators=(",", ":"), sort_keys=True) + "\n").encode('utf-8')
+            return 200, {"Content-Type": "application/json"}, body
+        if url.path != MANIFEST_ROUTE:
+            return 404, {"Content-Type": "text/plain"}, b"Not Found"
+        if method != "GET":
+            return 405, {"Content-Type": "text/plain", "Allow": "GET"}, b"Method Not Allowed"
+
+        query = parse_qs(url.query, keep_blank_values=True)
+        app_content_id = query.get('app_content_id', [None])[0]
+        target_version = query.get('target_version', [None])[0]
+        key = (app_content_id, target_version)
+        payload = response_cache.peek(key)
+        if payload is None:
+            # Identical requests await the same resolution without taking a permit
+            task = self.pending.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._resolve(app_content_id, target_version))
+                self.pending[key] = task
+                task.add_done_callback(lambda _: self.pending.pop(key, None))
+            payload = await asyncio.shield(task)
+        if manifest_mirror.enabled:
+            payload = await self.loop.run_in_executor(None, manifest_mirror.localize, payload)
+        # Same body as Flask's jsonify
+        body = (json.dumps(payload, separators=(",", ":"), sort_keys=True) + "\n").encode('utf-8')
+        return 200, {"Content-Type": "application/json"}, body
+
+    def _mirrored_manifest(self, downloadable_id: int, headers: dict) -> tuple[int, dict, bytes]:
+        path = manifest_mirror.path_for(downloadable_id) if manifest_mirror.root else None
+        if path is None or not path.exists():
+            return 404, {"Content-Type": "text/plain"}, b"Not Found"
+        response_headers = {"Content-Type": "application/octet-stream", "Accept-Ranges": "bytes"}
+        gzip_path = manifest_mirror.gzip_path_for(downloadable_id)
+        range_header = headers.get("range")
+        if "gzip" in headers.get("accept-encoding", "") and not range_header and gzip_path.exists():
+            response_headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+            return 200, response_headers, gzip_path.read_bytes()
+
+        size = path.stat().st_size
+        if not range_header:
+            return 200, response_headers, path.read_bytes()
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return 416, {"Content-Range": f"bytes */{size}"}, b""
+        start, end = byte_range
+        with open(path, 'rb') as f:
+            f.seek(start)
+            body = f.read(end - start + 1)
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return 206, response_headers, body
+
+    async def _resolve(self, app_content_id: str, target_version: str) -> dict:
+        async with self.semaphore:
+            return await self.loop.run_in_executor(None, get_manifest_response, app_content_id, target_version)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writers.add(writer)
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {"Content-Type": "text/plain"}, b"Bad Request", False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                try:
+                    status, extra_headers, body = await self._dispatch(method, target, headers)
+                except Exception as e:
+                    logging.error(f"Manifest server error: {e}")
+                    status, extra_headers, body = 500, {"Content-Type": "text/plain"}, b"Internal Server Error"
+                await self._respond(writer, status, extra_headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, headers: dict, body: bytes, keep_alive: bool):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        headers = {**headers, "Content-Length": str(len(body)), "Connection": "keep-alive" if keep_alive else "close"}
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,111 @@
+import json
+import time
+import random
+import logging
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+DEFAULT_RETRIES = 3
+DEFAULT_TIMEOUT = 10
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+MAX_VALIDATORS = 256
+# After a connection failure the network is treated as down for this long
+# by callers that have a cached fallback (see lookup_cache)
+OFFLINE_COOLDOWN = 30.0
+
+class HttpSession:
+    # Keep-alive connection pool shared by every thread, plus ETag /
+    # Last-Modified validators so unchanged responses come back as 304s.
+    def __init__(self):
+        self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        self.local = threading.local()
+        self.validators: dict[str, tuple[str, str, str]] = {}
+        self.offline_until = 0.0
+        self.lock = threading.Lock()
+
+    def session(self) -> requests.Session:
+        # requests.Session is not thread-safe, but the adapter's pool is,
+        # so each thread gets its own session over the shared pool.
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self.local.session = session
+        return session
+
+    def _conditional_get(self, url: str, timeout: float) -> dict:
+        with self.lock:
+            cached = self.validators.get(url)
+        headers = {}
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.session().get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            return json.loads(cached[2])
+        response.raise_for_status()
+        data = response.json()
+
+        etag = response.headers.get("ETag", "")
+        last_modified = response.headers.get("Last-Modified", "")
+        if etag or last_modified:
+            with self.lock:
+                self.validators.pop(url, None)
+                self.validators[url] = (etag, last_modified, response.text)
+                while len(self.validators) > MAX_VALIDATORS:
+                    self.validators.pop(next(iter(self.validators)))
+        return data
+
+    def get_json(self, url: str, params: dict = None, retries: int = DEFAULT_RETRIES, timeout: float = DEFAULT_TIMEOUT, cancel_event: threading.Event = None) -> dict:
+        full_url = requests.Request("GET", url, params=params).prepare().url
+        for i in range(retries):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            try:
+                data = self._conditional_get(full_url, timeout)
+                self.offline_until = 0.0
+                return data
+            except Exception as e:
+                logging.error(f"Request failed: {e}")
+                if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    self.offline_until = time.monotonic() + OFFLINE_COOLDOWN
+                if i + 1 < retries:
+                    if cancel_event is not None:
+                        cancel_event.wait(self._backoff(i))
+                    else:
+                        time.sleep(self._backoff(i))
+        return None
+
+    def exists(self, url: str, timeout: float = DEFAULT_TIMEOUT) -> bool:
+        # HEAD probe; redirects are followed since CDN URLs often bounce once
+        try:
+            response = self.session().head(url, timeout=timeout, allow_redirects=True)
+            return response.ok
+        except Exception as e:
+            logging.error(f"HEAD request failed: {e}")
+            return False
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent retries from hitting the API in lockstep
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt + 1)))
+
+    def is_offline(self) -> bool:
+        return time.monotonic() < self.offline_until
+
+http = HttpSession()
+
+def is_offline() -> bool:
+    return http.is_offline()
+
+def request_get(url: str, params: dict = None, retries: int = DEFAULT_RETRIES, timeout: float = DEFAULT_TIMEOUT, cancel_event: threading.Event = None) -> dict:
+    return http.get_json(url, params=params, retries=retries, timeout=timeout, cancel_event=cancel_event)
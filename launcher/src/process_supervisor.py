@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+import subprocess
+
+from collections import deque
+from dataclasses import dataclass
+
+# Exited processes kept for instances(include_exited=True)
+EXITED_HISTORY = 32
+
+@dataclass(slots=True)
+class ProcessEvent:
+    kind: str  # "start" or "exit"
+    name: str
+    pid: int
+    started_at: float
+    exit_code: int | None = None
+    # Seconds the process ran, set on exit
+    duration: float | None = None
+
+class SupervisedProcess:
+    def __init__(self, name: str, process: subprocess.Popen):
+        self.name = name
+        self.process = process
+        self.pid = process.pid
+        self.started_at = time.time()
+        self.started_monotonic = time.monotonic()
+        self.exit_code: int | None = None
+        self.exited = threading.Event()
+
+    def is_alive(self) -> bool:
+        return not self.exited.is_set()
+
+class ProcessSupervisor:
+    # Starts child processes and blocks on each one in its own waiter thread,
+    # so exits are reported as they happen instead of being polled for.
+    # Listeners are called with a ProcessEvent from the spawning thread
+    # ("start") or the waiter thread ("exit").
+    def __init__(self):
+        self.processes: dict[int, SupervisedProcess] = {}
+        self.exited: deque[SupervisedProcess] = deque(maxlen=EXITED_HISTORY)
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _emit(self, event: ProcessEvent):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logging.error(f"Process listener failed: {e}")
+
+    def spawn(self, name: str, args: list[str], **popen_kwargs) -> SupervisedProcess:
+        supervised = SupervisedProcess(name, subprocess.Popen(args, **popen_kwargs))
+        with self.lock:
+            self.processes[supervised.pid] = supervised
+        self._emit(ProcessEvent("start", name, supervised.pid, supervised.started_at))
+        threading.Thread(target=self._wait, args=(supervised,), daemon=True, name=f"wait-{supervised.pid}").start()
+        return supervised
+
+    def _wait(self, supervised: SupervisedProcess):
+        try:
+            supervised.exit_code = supervised.process.wait()
+        except Exception as e:
+            logging.error(f"Failed to wait for {supervised.name} ({supervised.pid}): {e}")
+        duration = time.monotonic() - supervised.started_monotonic
+        with self.lock:
+            self.processes.pop(supervised.pid, None)
+            self.exited.append(supervised)
+        supervised.exited.set()
+        logging.info(f"{supervised.name} ({supervised.pid}) exited with code {supervised.exit_code} after {duration:.0f}s")
+        self._emit(ProcessEvent("exit", supervised.name, supervised.pid, supervised.started_at, supervised.exit_code, duration))
+
+    def running(self) -> list[SupervisedProcess]:
+        with self.lock:
+            return list(self.processes.values())
+
+    def instances(self, name: str = None, include_exited: bool = False) -> list[SupervisedProcess]:
+        # Oldest first; each has pid, started_at, is_alive() and, once exited, exit_code
+        with self.lock:
+            found = list(self.exited) if include_exited else []
+            found += self.processes.values()
+        if name is not None:
+            found = [p for p in found if p.name == name]
+        return sorted(found, key=lambda p: p.started_monotonic)
+
+    def is_running(self) -> bool:
+        with self.lock:
+            return bool(self.processes)
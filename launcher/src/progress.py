@@ -1,6 +1,23 @@
-from dataclasses import dataclass
+import sys
+import json
+import math
+import time
+import logging
+import threading
 
-@dataclass
+from array import array
+from operator import attrgetter
+from dataclasses import dataclass, fields
+
+# Upper bound on how often progress snapshots are handed to consumers
+DEFAULT_PROGRESS_RATE = 20
+# Progress history: samples kept per phase, EMA time constant in seconds, and
+# how long a phase may go without advancing before it counts as stalled
+HISTORY_SIZE = 120
+EMA_TIME_CONSTANT = 5.0
+STALL_AFTER = 15.0
+
+@dataclass(slots=True)
 class DownloadProgress:
     StateFlags: int = -1
     ShowTextKey: str = ""
@@ -17,9 +34,251 @@ class DownloadProgress:
     ShowBuildSize: int = 0
     ShowBuildPercent: float = 0.0
 
+    # What the GUI actually renders; the raw rates and text key are not shown
+    VISIBLE_FIELDS = (
+        "StateFlags",
+        "ShowDownloadHeadRateStr", "ShowDownloadHeadSize", "ShowDownloadHeadPercent",
+        "ShowDownloadRateStr", "ShowDownloadSize", "ShowDownloadPercent",
+        "ShowBuildRateStr", "ShowBuildSize", "ShowBuildPercent"
+    )
+
+    # update_from(data) is generated from the field list below the class
+
     @classmethod
     def from_dict(cls, data: dict) -> DownloadProgress:
-        return cls(
+        progress = cls()
+        progress.update_from(data)
+        return progress
+
+    def diff(self, other: DownloadProgress | None) -> dict:
+        # Fields whose value differs from other, mapped to the value in self
+        if other is None:
+            return {name: getattr(self, name) for name, _ in _FIELDS}
+        return {
+            name: getattr(self, name)
+            for name, _ in _FIELDS if getattr(self, name) != getattr(other, name)
+        }
+
+    def visibly_equal(self, other: DownloadProgress | None) -> bool:
+        if other is None:
+            return False
+        return _visible(self) == _visible(other)
+
+_FIELDS = tuple((f.name, f.default) for f in fields(DownloadProgress))
+_visible = attrgetter(*DownloadProgress.VISIBLE_FIELDS)
+
+def _compile_decoder():
+    # One straight-line function with every field name and default baked in,
+    # instead of looping over the fields for each IPC message
+    lines = ["def update_from(self, data):", "    get = data.get"]
+    lines += [f"    self.{name} = get({name!r}, {default!r})" for name, default in _FIELDS]
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["update_from"]
+
+DownloadProgress.update_from = _compile_decoder()
+
+@dataclass(slots=True)
+class PhaseStats:
+    phase: str
+    percent: float = 0.0
+    # EMA-smoothed and whole-window throughput in bytes/s
+    rate: float = 0.0
+    window_rate: float = 0.0
+    # Seconds left, None while no rate is known
+    eta: float | None = None
+    stalled: bool = False
+    samples: int = 0
+
+class PhaseHistory:
+    # Fixed-size ring of (time, bytes, percent) samples for one phase, plus
+    # time-weighted EMAs of the byte and percent rates. Samples go into
+    # preallocated arrays, so recording allocates nothing per sample.
+    __slots__ = ("times", "sizes", "percents", "head", "count", "rate", "percent_rate", "last_advance")
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.times = array('d', [0.0]) * size
+        self.sizes = array('d', [0.0]) * size
+        self.percents = array('d', [0.0]) * size
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.rate = 0.0
+        self.percent_rate = 0.0
+        self.last_advance = 0.0
+
+    def _last(self) -> int:
+        return (self.head - 1) % len(self.times)
+
+    def record(self, now: float, size: float, percent: float):
+        if self.count:
+            last = self._last()
+            dt = now - self.times[last]
+            if dt <= 0:
+                return
+            rate = max(0.0, (size - self.sizes[last]) / dt)
+            percent_rate = max(0.0, (percent - self.percents[last]) / dt)
+            if self.count == 1:
+                self.rate, self.percent_rate = rate, percent_rate
+            else:
+                # Weighting by elapsed time keeps irregular sample spacing from skewing the average
+                weight = 1.0 - math.exp(-dt / EMA_TIME_CONSTANT)
+                self.rate += weight * (rate - self.rate)
+                self.percent_rate += weight * (percent_rate - self.percent_rate)
+            if size > self.sizes[last] or percent > self.percents[last]:
+                self.last_advance = now
+        else:
+            self.last_advance = now
+        self.times[self.head] = now
+        self.sizes[self.head] = size
+        self.percents[self.head] = percent
+        self.head = (self.head + 1) % len(self.times)
+        self.count = min(self.count + 1, len(self.times))
+
+    def stats(self, phase: str, now: float) -> PhaseStats:
+        if not self.count:
+            return PhaseStats(phase)
+        last = self._last()
+        oldest = (self.head - self.count) % len(self.times)
+        percent = self.percents[last]
+        span = self.times[last] - self.times[oldest]
+        if percent >= 1.0:
+            eta = 0.0
+        elif self.percent_rate > 0:
+            eta = (1.0 - percent) / self.percent_rate
+        else:
+            eta = None
+        return PhaseStats(
+            phase=phase,
+            percent=percent,
+            rate=self.rate,
+            window_rate=(self.sizes[last] - self.sizes[oldest]) / span if span > 0 else 0.0,
+            eta=eta,
+            # A phase still at 0% may just be waiting its turn (build waits on download)
+            stalled=0.0 < percent < 1.0 and now - self.last_advance >= STALL_AFTER,
+            samples=self.count
+        )
+
+    def samples(self) -> list[tuple[float, float, float]]:
+        size = len(self.times)
+        start = self.head - self.count
+        return [
+            (self.times[i % size], self.sizes[i % size], self.percents[i % size])
+            for i in range(start, self.head)
+        ]
+
+class ProgressHistory:
+    # Progress history of one download run, split into the indexing, download
+    # and build phases. Fed from the progress thread and queried from any
+    # thread, e.g. the GUI or headless logging.
+    PHASES = ("indexing", "download", "build")
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        self.phases = {phase: PhaseHistory(size) for phase in self.PHASES}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            for history in self.phases.values():
+                history.reset()
+
+    def record(self, progress: DownloadProgress, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if progress.StateFlags == 3:
+                self.phases["indexing"].record(now, progress.ShowDownloadHeadSize, progress.ShowDownloadHeadPercent)
+            elif 4 <= progress.StateFlags <= 8:
+                self.phases["download"].record(now, progress.ShowDownloadSize, progress.ShowDownloadPercent)
+                self.phases["build"].record(now, progress.ShowBuildSize, progress.ShowBuildPercent)
+
+    def stats(self, phase: str, now: float = None) -> PhaseStats:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return self.phases[phase].stats(phase, now)
+
+    def samples(self, phase: str) -> list[tuple[float, float, float]]:
+        with self.lock:
+            return self.phases[phase].samples()
+
+def format_eta(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+class ProgressCoalescer:
+    # Sits between the ZMQ thread and the progress callback. Only the newest
+    # raw message per state is kept, and pending snapshots are decoded and
+    # published from a separate thread at most `rate` times per second, so a
+    # chatty downloadIPC cannot flood the Tk event queue or stall the socket.
+    def __init__(self, callback, rate: int = DEFAULT_PROGRESS_RATE):
+        self.callback = callback
+        self.interval = 1.0 / max(1, rate)
+        self.pending: dict[int, bytes] = {}
+        self.lock = threading.Lock()
+        self.publish_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = threading.Event()
+        self.thread = None
+        self.received = 0
+        self.published = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True, name="progress")
+        self.thread.start()
+
+    def submit(self, state: int, raw: bytes):
+        with self.lock:
+            # Re-inserting keeps the most recently updated state last
+            self.pending.pop(state, None)
+            self.pending[state] = raw
+            self.received += 1
+        self.wakeup.set()
+
+    def flush(self):
+        with self.publish_lock:
+            with self.lock:
+                batch = list(self.pending.values())
+                self.pending.clear()
+            for raw in batch:
+                try:
+                    progress = DownloadProgress.from_dict(json.loads(raw))
+                    self.callback(progress)
+                    self.published += 1
+                except Exception as e:
+                    logging.error(f"Failed to publish progress: {e}")
+
+    def _run(self):
+        while not self.closed.is_set():
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if self.closed.is_set():
+                break
+            self.flush()
+            self.closed.wait(self.interval)
+
+    def close(self):
+        # Publishes whatever is still pending, so the final state is never lost
+        self.closed.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+        self.flush()
+
+def benchmark(count: int = 200000):
+    message = {
+        "StateFlags": 4, "ShowTextKey": "downloading",
+        "ShowDownloadRate": 10485760.0, "ShowDownloadRateStr": "10.00 MB/s",
+        "ShowDownloadSize": 123456789, "ShowDownloadPercent": 0.4567,
+        "ShowBuildRate": 5242880.0, "ShowBuildRateStr": "5.00 MB/s",
+        "ShowBuildSize": 98765432, "ShowBuildPercent": 0.3456
+    }
+
+    def legacy_from_dict(data: dict) -> DownloadProgress:
+        # The per-field constructor from_dict replaced, as the baseline
+        return DownloadProgress(
             StateFlags=data.get("StateFlags", -1),
             ShowTextKey=data.get("ShowTextKey", ""),
             ShowDownloadHeadRate=data.get("ShowDownloadHeadRate", 0.0),
@@ -34,4 +293,23 @@ class DownloadProgress:
             ShowBuildRateStr=data.get("ShowBuildRateStr", "0.00 B/s"),
             ShowBuildSize=data.get("ShowBuildSize", 0),
             ShowBuildPercent=data.get("ShowBuildPercent", 0.0)
-        )
\ No newline at end of file
+        )
+
+    reused = DownloadProgress()
+    previous = DownloadProgress.from_dict(message)
+    cases = [
+        ("legacy from_dict", lambda: legacy_from_dict(message)),
+        ("from_dict", lambda: DownloadProgress.from_dict(message)),
+        ("update_from (reused)", lambda: reused.update_from(message)),
+        ("visibly_equal", lambda: reused.visibly_equal(previous))
+    ]
+    for label, func in cases:
+        start = time.perf_counter()
+        for _ in range(count):
+            func()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<22} {elapsed / count * 1e9:8.0f} ns/message")
+    print(f"{'instance size':<22} {sys.getsizeof(reused):8d} bytes (no __dict__: {not hasattr(reused, '__dict__')})")
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,106 @@
+import json
+import logging
+import threading
+
+from pathlib import Path
+from game_state import GameState
+
+# How often watched state files are re-checked, in seconds
+POLL_INTERVAL = 1.0
+
+def state_path_for(dir_path: Path, game_id: int) -> Path:
+    return Path(dir_path) / ".dlstorage" / "downloading" / f"{game_id}_app.state"
+
+class StateWatch:
+    def __init__(self, path: Path, callback, state: GameState | None):
+        self.path = path
+        self.callback = callback
+        self.state = state
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class GameStateRepository:
+    # Parsed {game_id}_app.state files keyed by path and only re-read when the
+    # file's mtime or size changes. The returned GameState is shared between
+    # callers and must not be modified.
+    #
+    # watch() polls the file (there is no portable file-change API in the
+    # stdlib, and downloadIPC rewrites it in place) and calls
+    # callback(old_state, new_state) from the poll thread when it changes.
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.entries: dict[Path, tuple[int, int, GameState | None]] = {}
+        self.watches: list[StateWatch] = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.wakeup = threading.Condition(self.lock)
+
+    def _load(self, path: Path) -> GameState | None:
+        try:
+            st = path.stat()
+        except OSError:
+            with self.lock:
+                self.entries.pop(path, None)
+            return None
+        with self.lock:
+            cached = self.entries.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+
+        try:
+            with open(path, 'r') as f:
+                state = GameState.from_dict(json.load(f))
+        except Exception as e:
+            # Usually a read racing a rewrite; the previous state stands and
+            # the next call retries since the cache key was not updated
+            logging.error(f"Error reading state file: {e}")
+            return cached[2] if cached else None
+        with self.lock:
+            self.entries[path] = (st.st_mtime_ns, st.st_size, state)
+        return state
+
+    def get(self, dir_path: Path, game_id: int) -> GameState | None:
+        return self._load(state_path_for(dir_path, game_id))
+
+    def invalidate(self, dir_path: Path = None, game_id: int = None):
+        with self.lock:
+            if dir_path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(state_path_for(dir_path, game_id), None)
+
+    def watch(self, dir_path: Path, game_id: int, callback) -> StateWatch:
+        path = state_path_for(dir_path, game_id)
+        watch = StateWatch(path, callback, self._load(path))
+        with self.lock:
+            self.watches.append(watch)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._poll, daemon=True, name="state-watch")
+                self.thread.start()
+        return watch
+
+    def _poll(self):
+        while True:
+            with self.lock:
+                self.wakeup.wait(self.poll_interval)
+                self.watches = [watch for watch in self.watches if not watch.cancelled]
+                if not self.watches:
+                    self.thread = None
+                    return
+                watches = list(self.watches)
+
+            for watch in watches:
+                state = self._load(watch.path)
+                if state is watch.state or state == watch.state:
+                    continue
+                old, watch.state = watch.state, state
+                if watch.cancelled:
+                    continue
+                try:
+                    watch.callback(old, state)
+                except Exception as e:
+                    logging.error(f"Game state watcher failed: {e}")
+
+game_states = GameStateRepository()
@@ -1,46 +1,28 @@
 import os
-import json
-import time
 import shutil
 import logging
 import base64
-import hashlib
-import requests
+import threading
 
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
-from game_state import GameState
+from state_cache import game_states
+from net import request_get
+from lookup_cache import cached_get
+from hashing import hash_file, files_equal
+from integrity import VerifyIndex, VerifyScheduler, ProcessVerifyEngine, ManifestReader, precheck_entries, until_cancelled
 
 # Global Thread Pool for both long-running servers and short-lived tasks
 executor = ThreadPoolExecutor(max_workers=os.cpu_count() * 2)
+# Separate pool for network lookups fanned out from tasks already running on executor
+lookup_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lookup")
 LOGIN_DATA = "TddjSAPGzlIBXo5/eXRfw+slaoO/7ofwM5vWQnQ0zkLRelV7qVdCDH/Sn5qVjtdfo/Xm+6vXBvzZtqmUFkvRiPdr2l5aQ8cJx8980VZ5/pbr0cXy3Dy8jYVtcNrnQ8N0izNJAe8k3RJzuleig9CXwIF+MGTWuyUrqGavjD3M8WVMru8SeNAjIUjVXx3kqdVXETfBJKW0lIM5mszDTp46Vozewbn+wRfCDCJ6dC4h8E7aQ/M1HchDDvWS8kUS64cIRqrSGW6UBbnFxjAzWbwtyQP3w/tqWmfhNgkjDFMTmooZxhkmsP42PWO4crpJ+mkzKzH29Xo69gH6aAjhfaFN15Nv6AZQfxUPDmBEqKIbJ2RsX3fSSdqzNvfzjGeg6x9LWzq/6It9RPQXgCDw8Iavvj9m+Bmo+fd5VkcXR1eS52xIPqqscx4Vg/hy1KGardvxH9/11mVewyvI5C1Bweu6KF5iDm1hhYEl6OUV+5xjlU3MODhYcRyg+WI4r9FFavXfKTk4farX1y1/lUgNsd0NN65hxFG5eUjVg4u7ym7nEXoc5wMV86j1k3WN8S6F7nb5"
 API_LATEST_BUILD = "https://loadingbaycn.webapp.163.com/app/v1/file_distribution/latest_build?app_ids=[{game_id}]"
 API_MANIFEST_URL = "https://loadingbaycn.webapp.163.com/app/v1/file_distribution_v2/manifest_url?app_content_id={content_id}&target_version={version_code}"
 
-def request_get(url: str, params: dict = None) -> dict:
-    for i in range(3):
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logging.error(f"Request failed: {e}")
-            time.sleep(i * 2)
-
 def parse_game_state(dir_path: Path, game_id: int):
-    if isinstance(dir_path, str):
-        dir_path = Path(dir_path)
-    state_path = dir_path / ".dlstorage" / "downloading" / f"{game_id}_app.state"
-    if not state_path.exists():
-        return None
-        
-    try:
-        with open(state_path, 'r') as f:
-            state_data = json.load(f)
-            return GameState.from_dict(state_data)
-    except Exception as e:
-        logging.error(f"Error reading state file: {e}")
-        return None
+    # Cached; only re-parsed when the state file changes
+    return game_states.get(dir_path, game_id)
 
 def encode_path(path: str) -> str:
     if not path:
@@ -50,7 +32,7 @@ def encode_path(path: str) -> str:
 def get_latest_version(game_id: int) -> dict:
     api = API_LATEST_BUILD.format(game_id=game_id)
     try:
-        data = request_get(api)
+        data = cached_get(api)
         if data is not None and data.get("code") == 200:
             apps: dict = data.get("data", {}).get("apps", [])
             if apps:
@@ -71,7 +53,7 @@ def get_downloadable_id(content_id: int, version_code: str) -> int:
     default_id = int(version_code.split("_")[1]) if version_code and "_" in version_code else 0
     api = API_MANIFEST_URL.format(content_id=content_id, version_code=version_code)
     try:
-        data = request_get(api)
+        data = cached_get(api)
         if data is not None and data.get("code") == 200:
             downloadable_id = data.get("data", {}).get("downloadable_id", default_id)
             return downloadable_id if downloadable_id is not None else default_id
@@ -79,7 +61,7 @@ def get_downloadable_id(content_id: int, version_code: str) -> int:
         logging.error(f"Failed to get downloadable ID: {e}")
     return default_id
 
-def check_resource(base_path: str, game_id: int, content_id: int, progress_callback=None) -> list[str]:
+def check_resource(base_path: str, game_id: int, content_id: int, progress_callback=None, force_rehash: bool = False, quick: bool = False, is_ssd: bool = True, engine: str = "thread", processes: int = 0, cancel_event: threading.Event = None) -> list[str] | None:
     repair_file_list = []
     state_path = Path(base_path) / ".dlstorage" / "downloading" / f"{game_id}_app.state"
     if not state_path.exists():
@@ -89,49 +71,100 @@ def check_resource(base_path: str, game_id: int, content_id: int, progress_callb
     if game_state is None or game_state.StateFlag != 8:
         return repair_file_list
     
-    def verify_file(file_info: dict) -> str | None:
-        if file_info.get("dir", 0) != 0: return None
-        name = file_info.get("name", "")
-        md5 = file_info.get("md5", "")
-        if not name or not md5: return None
-        
-        target = Path(base_path) / Path(name)
-        if not target.exists(): return name
+    content_info = game_state.installed_contents.get(str(content_id))
+    downloadable_id = content_info.DownloadableId if content_info else None
+    index = VerifyIndex.load(base_path, content_id, downloadable_id)
+    if force_rehash:
+        index.begin_rehash()
+    scheduler = VerifyScheduler(is_ssd)
+
+    def verify_file(item: tuple) -> bool:
+        entry, _ = item
         try:
-            hasher = hashlib.md5()
-            with open(target, 'rb') as f:
-                for chunk in iter(lambda: f.read(8192), b""):
-                    hasher.update(chunk)
-            file_md5 = hasher.hexdigest()
-            if file_md5 != md5: return name
-        except Exception: return name
-        return None
+            return hash_file(Path(base_path) / Path(entry.name), chunk_size=scheduler.chunk_size) == entry.md5
+        except Exception:
+            return False
 
     try:
-        content_info = game_state.installed_contents.get(str(content_id))
-        downloadable_id = content_info.DownloadableId if content_info else None
         manifest_path = Path(base_path) / ".dlstorage" / "depotcache" / f"{content_id}_{downloadable_id}.manifest"
         if manifest_path.exists():
-            with open(manifest_path, 'r') as f:
-                manifest_data: dict = json.load(f)
-                
-            file_list = manifest_data.get("files", [])
-            total = len(file_list)
-            
-            from concurrent.futures import as_completed
-            futures = [executor.submit(verify_file, f) for f in file_list]
+            # Entries are hashed while the manifest is still being parsed, so
+            # the reported total grows until parsing completes.
+            reader = ManifestReader(manifest_path)
+            result_lock = threading.Lock()
+            checked = 0
+
+            def on_resolved(name: str | None):
+                nonlocal checked
+                with result_lock:
+                    checked += 1
+                    if name:
+                        index.discard(name)
+                        repair_file_list.append(name)
+                    if progress_callback and checked % 10 == 0:
+                        progress_callback(checked, reader.count)
+                index.checkpoint()
+
+            def report_progress():
+                if progress_callback:
+                    progress_callback(checked, reader.count)
+
+            def on_verified(item: tuple, ok: bool):
+                entry, st = item
+                if ok:
+                    index.record(entry.name, st, entry.md5)
+                on_resolved(None if ok else entry.name)
+
+            def uncached(items):
+                for entry, st in items:
+                    if index.lookup(entry.name, st, entry.md5):
+                        on_resolved(None)
+                        continue
+                    yield entry, st
             
-            for i, future in enumerate(as_completed(futures)):
-                res = future.result()
-                if res:
-                    repair_file_list.append(res)
-                if progress_callback and (i + 1) % 10 == 0:
-                    progress_callback(i + 1, total)
+            pending = precheck_entries(base_path, until_cancelled(reader, cancel_event), on_resolved)
+            if quick:
+                for _ in pending:
+                    on_resolved(None)
+            elif engine == "process":
+                # Hashed files arrive a shard at a time, so each one is
+                # reported instead of every 10th
+                def on_hashed(item: tuple, ok: bool):
+                    on_verified(item, ok)
+                    report_progress()
+                ProcessVerifyEngine(processes, scheduler.chunk_size).run(base_path, uncached(pending), on_hashed, cancel_event=cancel_event)
+            else:
+                scheduler.run(uncached(pending), verify_file, on_verified, key=lambda item: item[0].name, cancel_event=cancel_event)
+            report_progress()
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info(f"Integrity check cancelled after {checked} files")
+                return None
+            index.finish()
     except Exception as e:
         logging.error(f"Error reading state file: {e}")
+    finally:
+        index.save()
 
     return repair_file_list
 
+def _stat_key(path: Path) -> tuple | None:
+    try:
+        st = path.stat()
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+def launch_fingerprint(game_path: str, dll_path: Path, unlimited: bool) -> tuple:
+    # Everything launch preparation touches, by size and mtime; if this is
+    # unchanged since the last preparation the game directory is still patched
+    return (
+        str(game_path),
+        unlimited,
+        _stat_key(Path(game_path) / "netease.data"),
+        _stat_key(Path(game_path) / "version.dll"),
+        _stat_key(dll_path) if unlimited else None
+    )
+
 def patch_login(base_path: str):
     try:
         target_path = Path(base_path) / "netease.data"
@@ -145,9 +178,7 @@ def patch_dll(source_path: Path, target_dir: Path):
     try:
         target_path = target_dir / source_path.name
         if target_path.exists():
-            hash_source = hashlib.md5(source_path.read_bytes()).hexdigest()
-            hash_target = hashlib.md5(target_path.read_bytes()).hexdigest()
-            if hash_source == hash_target:
+            if files_equal(source_path, target_path):
                 return
             else:
                 target_path.unlink()